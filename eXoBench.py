@@ -0,0 +1,328 @@
+# coding=UTF-8
+# eXoLauncher benchmarks, on a synthetic eXoDOS collection and with a stub DOSBox
+import zipfile
+import os.path
+import os
+import sys
+import getopt
+import shutil
+import time
+import subprocess
+import logging
+import random
+import struct
+import zlib
+import json
+from xml.sax.saxutils import escape
+from eXoLauncher import parseSize, formatSize, getDirSize
+
+#*****************************************************************
+# Constants
+_eXoBenchHelp 		= "Usage : eXoBench.py [-d <directory>] [-g <games>] [-s <game size>] [-f <files per game>] [-x <LaunchBox games>] [-n <launches>] [-j <jobs>] [-b <benchmarks>] [--seed=<seed>] [--regenerate]"
+_Benchmarks			= ["import", "launchbox", "cold", "warm", "eviction"]
+_Platforms			= ["MS-DOS", "Arcade", "Nintendo Entertainment System", "Super Nintendo Entertainment System", "Sega Genesis", "Commodore Amiga"]
+_BlockSize			= 64 * 1024
+_SharedDriverSize	= 256 * 1024
+
+# Generated data & benchmark run directories
+_DataDir			= "data"
+_RunDir				= "run"
+_CollectionDir		= "eXoDOS"
+_eXoDir				= "exo"
+_LaunchBoxDir		= "LaunchBox"
+_ImportDir			= "import"
+_ParamsFile			= "eXoBench.json"
+
+#*****************************************************************
+# Globals
+scriptdir			= os.path.dirname(os.path.realpath(__file__))
+launcherpath		= os.path.join(scriptdir, "eXoLauncher.py")
+
+#*****************************************************************
+#*****************************************************************
+# Synthetic collection
+#*****************************************************************
+#*****************************************************************
+def getGameName(index, rnd):
+	return "Bench Game %04i (19%02i)" % (index, rnd.randint(80, 99))
+
+def getGameDir(index):
+	return "BG%04i" % index
+
+def makePng(width, height, seed):
+	# Gradient image, no PIL needed
+	rows = []
+	for y in range(height):
+		rows.append("\x00" + "".join(chr((x + seed) & 0xFF) + chr((y + seed) & 0xFF) + chr(seed & 0xFF) for x in range(width)))
+	def chunk(tag, data):
+		return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data) & 0xFFFFFFFF)
+	return ("\x89PNG\r\n\x1a\n" +
+	chunk("IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)) +
+	chunk("IDAT", zlib.compress("".join(rows))) +
+	chunk("IEND", ""))
+
+def writeGameArchive(archivePath, gameDir, params, block, sharedDriver):
+	# Member contents are shifted blocks of random data, compressing them is not free
+	fileSize = max(1, params["size"] // params["files"])
+	zfile = zipfile.ZipFile(archivePath, "w", zipfile.ZIP_DEFLATED)
+	try:
+		for index in range(params["files"]):
+			offset 	= (index * 4099 + len(gameDir)) % _BlockSize
+			data 	= (block[offset:] + block[:offset]) * (fileSize // _BlockSize + 1)
+			zfile.writestr("%s/DATA%i/FILE%04i.DAT" % (gameDir, index % 4, index), data[:fileSize])
+		zfile.writestr("%s/DRIVERS/SB16.DRV" % gameDir, sharedDriver)
+	finally:
+		zfile.close()
+
+def writeGame(dataDir, index, gamename, params, rnd, block, sharedDriver):
+	gameDir		= getGameDir(index)
+	eXoGameDir 	= os.path.join(dataDir, _CollectionDir, "!dos", gamename)
+	meagreDir 	= os.path.join(eXoGameDir, "Meagre")
+	for dir in ["About", "Front", "Screen", "Manual"]:
+		os.makedirs(os.path.join(meagreDir, dir))
+
+	# Collection game
+	with open(os.path.join(eXoGameDir, "Install.bat"), "wb") as fo:
+		fo.write('@echo off\r\ncls\r\nunzip "%s.zip"\r\n' % gamename)
+	with open(os.path.join(eXoGameDir, gamename + ".ini"), "wb") as fo:
+		fo.write("[Main]\r\nName=%s\r\nPublisher=Publisher %i\r\nDeveloper=Developer %i\r\nYear=%s\r\nGenre=%s\r\nSubGenre=Benchmark\r\nSeries=\r\nAbout=about.txt\r\nFront01=front.png\r\nScreen01=screen.png\r\nManual=manual.pdf\r\n"
+		% (gamename, rnd.randint(1, 50), rnd.randint(1, 50), gamename[-5:-1], rnd.choice(["Action", "Adventure", "RPG", "Simulation", "Strategy"])))
+	with open(os.path.join(eXoGameDir, "dosbox.conf"), "wb") as fo:
+		fo.write("[sdl]\r\nfullscreen=true\r\n[render]\r\naspect=true\r\n[cpu]\r\ncore=auto\r\ncycles=%i\r\n[autoexec]\r\n@echo off\r\nmount c .\\games\\%s\r\nc:\r\ncls\r\nGAME.EXE\r\nexit\r\n" % (rnd.randint(3, 60) * 1000, gameDir))
+	with open(os.path.join(meagreDir, "About", "about.txt"), "wb") as fo:
+		fo.write("Synthetic game %i.\r\n" % index * 20)
+	with open(os.path.join(meagreDir, "Front", "front.png"), "wb") as fo:
+		fo.write(makePng(320, 400, index))
+	with open(os.path.join(meagreDir, "Screen", "screen.png"), "wb") as fo:
+		fo.write(makePng(320, 200, index + 1))
+	with open(os.path.join(meagreDir, "Manual", "manual.pdf"), "wb") as fo:
+		fo.write("%PDF-1.4\n" + block[:16 * 1024])
+	writeGameArchive(os.path.join(dataDir, _CollectionDir, gamename + ".zip"), gameDir, params, block, sharedDriver)
+
+	# eXo file, as created by an import
+	zfile = zipfile.ZipFile(os.path.join(dataDir, _eXoDir, gamename + ".exo"), "w")
+	try:
+		zfile.writestr("game.ini", "[Main]\nGameName = %s\nArchive = %s.zip\n\n" % (gamename, gamename))
+		zfile.writestr("dosbox.conf", "[cpu]\r\ncore=auto\r\n[autoexec]\r\n@echo off\r\nmount c __DB_ROOT_DIR__\\%s\r\nc:\r\nGAME.EXE\r\nexit\r\n" % gameDir)
+	finally:
+		zfile.close()
+
+def writeLaunchBoxXml(xmlPath, params, rnd):
+	# Games of every platform, the MS-DOS ones are replaced by the export
+	with open(xmlPath, "wb") as fo:
+		fo.write('<?xml version="1.0" standalone="yes"?>\r\n<LaunchBox>\r\n')
+		for platform in _Platforms:
+			fo.write("  <Platform>\r\n    <Name>%s</Name>\r\n  </Platform>\r\n" % escape(platform))
+		for index in range(params["lbgames"]):
+			platform = rnd.choice(_Platforms)
+			fo.write("  <Game>\r\n    <ID>00000000-0000-0000-0000-%012i</ID>\r\n    <Title>Game %i</Title>\r\n    <ApplicationPath>Games\\%s\\Game %i.zip</ApplicationPath>\r\n    <Developer>Developer %i</Developer>\r\n    <Notes>%s</Notes>\r\n    <Platform>%s</Platform>\r\n  </Game>\r\n"
+			% (index, index, escape(platform), index, rnd.randint(1, 50), "Lorem ipsum " * rnd.randint(1, 40), escape(platform)))
+		fo.write("</LaunchBox>\r\n")
+
+def generateCollection(dataDir, params):
+	logging.info("Generating %i games of %s (%i files) & %i LaunchBox games in '%s'...", params["games"], formatSize(params["size"]), params["files"], params["lbgames"], dataDir)
+	if os.path.isdir(dataDir):
+		shutil.rmtree(dataDir)
+	os.makedirs(os.path.join(dataDir, _CollectionDir, "!dos"))
+	os.makedirs(os.path.join(dataDir, _eXoDir))
+	for dir in ["Games", "Images", "Manuals"]:
+		os.makedirs(os.path.join(dataDir, _LaunchBoxDir, dir))
+
+	rnd 			= random.Random(params["seed"])
+	block 			= "".join(chr(rnd.getrandbits(8)) for i in range(_BlockSize))
+	sharedDriver 	= (block * (_SharedDriverSize // _BlockSize))
+	gamenames 		= []
+	for index in range(params["games"]):
+		gamename = getGameName(index, rnd)
+		writeGame(dataDir, index, gamename, params, rnd, block, sharedDriver)
+		gamenames.append(gamename)
+	writeLaunchBoxXml(os.path.join(dataDir, _LaunchBoxDir, "LaunchBox.xml"), params, rnd)
+
+	# Written last, an interrupted generation is done again
+	with open(os.path.join(dataDir, _ParamsFile), "wb") as fo:
+		json.dump({ "params" : params, "games" : gamenames }, fo, indent=1)
+	return gamenames
+
+def loadCollection(dataDir, params, doRegenerate):
+	# The collection is generated again only when its parameters change
+	paramsFile = os.path.join(dataDir, _ParamsFile)
+	if not doRegenerate and os.path.isfile(paramsFile):
+		with open(paramsFile, "rb") as fi:
+			data = json.load(fi)
+		if data["params"] == params:
+			logging.info("Using the collection generated in '%s'", dataDir)
+			return data["games"]
+	return generateCollection(dataDir, params)
+
+#*****************************************************************
+#*****************************************************************
+# Benchmarks
+#*****************************************************************
+#*****************************************************************
+def makeRunDir(benchDir, slotsBudget = None):
+	# A fresh eXoLauncher installation, with a stub DOSBox
+	runDir 	= os.path.join(benchDir, _RunDir)
+	dataDir	= os.path.join(benchDir, _DataDir)
+	if os.path.isdir(runDir):
+		shutil.rmtree(runDir)
+	os.makedirs(os.path.join(runDir, _ImportDir))
+	shutil.copyfile(launcherpath, os.path.join(runDir, "eXoLauncher.py"))
+
+	if os.name == "nt":
+		dbExePath = os.path.join(runDir, "dosbox.bat")
+		with open(dbExePath, "wb") as fo:
+			fo.write("@exit /b 0\r\n")
+	else:
+		dbExePath = os.path.join(runDir, "dosbox.sh")
+		with open(dbExePath, "wb") as fo:
+			fo.write("#!/bin/sh\nexit 0\n")
+		os.chmod(dbExePath, 0755)
+	with open(os.path.join(runDir, "dosbox.conf"), "wb") as fo:
+		fo.write("[sdl]\r\nfullscreen=false\r\n[cpu]\r\ncycles=auto\r\n[autoexec]\r\n")
+	with open(os.path.join(runDir, "eXoLauncher.ini"), "wb") as fo:
+		fo.write("[Main]\r\nDosBOX = %s\r\n" % dbExePath)
+		if slotsBudget is not None:
+			fo.write("SlotsBudget = %i\r\n" % slotsBudget)
+		fo.write("\r\n[Collections]\r\neXoDOS = %s\r\n" % os.path.join(dataDir, _CollectionDir))
+
+	# LaunchBox from its pristine copy
+	shutil.copytree(os.path.join(dataDir, _LaunchBoxDir), os.path.join(runDir, _LaunchBoxDir))
+	return runDir
+
+def runLauncher(runDir, args):
+	# Elapsed time & peak RSS (bytes, None when unknown) of one eXoLauncher process
+	with open(os.devnull, "wb") as devnull:
+		start 	= time.time()
+		process = subprocess.Popen([sys.executable, "eXoLauncher.py", "--no-daemon"] + args, cwd=runDir, stdout=devnull, stderr=subprocess.STDOUT)
+		if hasattr(os, "wait4"):
+			pid, status, usage = os.wait4(process.pid, 0)
+			process.returncode = os.WEXITSTATUS(status)
+			peakRSS = usage.ru_maxrss if sys.platform == "darwin" else usage.ru_maxrss * 1024
+		else:
+			process.wait()
+			peakRSS = None
+		elapsed = time.time() - start
+	if process.returncode != 0:
+		logging.error("eXoLauncher %s failed(%i), see '%s'!", " ".join(args), process.returncode, os.path.join(runDir, "eXoLauncher.log"))
+		sys.exit(1)
+	return (elapsed, peakRSS)
+
+def getArchivesSize(benchDir, gamenames):
+	return sum(os.path.getsize(os.path.join(benchDir, _DataDir, _CollectionDir, gamename + ".zip")) for gamename in gamenames)
+
+def launchGames(runDir, benchDir, gamenames):
+	return [runLauncher(runDir, ["-r", os.path.join(benchDir, _DataDir, _eXoDir, gamename + ".exo"), "--launch"]) for gamename in gamenames]
+
+def benchImport(benchDir, gamenames, params):
+	runDir = makeRunDir(benchDir)
+	return ([runLauncher(runDir, ["-i", os.path.join(benchDir, _DataDir, _CollectionDir), "-o", _ImportDir, "-a", "-m", "-j", str(params["jobs"])])],
+	len(gamenames), getDirSize(os.path.join(benchDir, _DataDir, _CollectionDir, "!dos")))
+
+def benchLaunchBox(benchDir, gamenames, params):
+	runDir = makeRunDir(benchDir)
+	return ([runLauncher(runDir, ["-l", os.path.join(benchDir, _DataDir, _CollectionDir), "-o", _LaunchBoxDir, "-a", "-m", "-j", str(params["jobs"])])],
+	len(gamenames), os.path.getsize(os.path.join(benchDir, _DataDir, _LaunchBoxDir, "LaunchBox.xml")))
+
+def benchColdLaunch(benchDir, gamenames, params):
+	# Every game is extracted into an empty slot
+	launched = gamenames[:params["launches"]]
+	runDir = makeRunDir(benchDir)
+	return (launchGames(runDir, benchDir, launched), len(launched), getArchivesSize(benchDir, launched))
+
+def benchWarmLaunch(benchDir, gamenames, params):
+	# Every game is already in its slot, only verified
+	launched = gamenames[:min(params["launches"], 10)]
+	runDir = makeRunDir(benchDir)
+	launchGames(runDir, benchDir, launched)
+	return (launchGames(runDir, benchDir, launched), len(launched), getArchivesSize(benchDir, launched))
+
+def benchEviction(benchDir, gamenames, params):
+	# The slots budget holds two games, every launch evicts the least recently used one
+	filled 		= gamenames[:2]
+	launched 	= gamenames[2:2 + params["launches"]]
+	runDir 		= makeRunDir(benchDir, int(params["size"] * 2.5))
+	launchGames(runDir, benchDir, filled)
+	return (launchGames(runDir, benchDir, launched), len(launched), getArchivesSize(benchDir, launched))
+
+def reportBenchmark(name, runs, items, size):
+	total 	= sum(elapsed for elapsed, peakRSS in runs)
+	peaks 	= [peakRSS for elapsed, peakRSS in runs if peakRSS is not None]
+	logging.info("> %-10s %4i runs %9.3fs %8.3fs/run %9.1f games/s %10s/s  peak RSS %s",
+	name, len(runs), total, total / max(1, len(runs)), items / max(total, 1e-6), formatSize(size / max(total, 1e-6)),
+	formatSize(max(peaks)) if peaks else "n/a")
+
+#*****************************************************************
+#*****************************************************************
+# Main
+#*****************************************************************
+#*****************************************************************
+def main(argv):
+	root = logging.getLogger()
+	root.setLevel(logging.INFO)
+	stdoutHandler = logging.StreamHandler(sys.stdout)
+	stdoutHandler.setFormatter(logging.Formatter('%(message)s'))
+	root.addHandler(stdoutHandler)
+
+	# Arguments
+	benchDir		= os.path.join(os.getcwd(), "eXoBench")
+	benchmarks		= list(_Benchmarks)
+	doRegenerate	= False
+	params			= { "games" : 100, "size" : 4 * 1024 * 1024, "files" : 20, "lbgames" : 5000, "seed" : 1 }
+	launches		= 10
+	jobs			= 1
+	try:
+	  opts, args = getopt.getopt(argv, "hd:g:s:f:x:n:j:b:", ["dir=","games=","size=","files=","lb-games=","launches=","jobs=","bench=","seed=","regenerate"])
+	except getopt.GetoptError:
+	  logging.info(_eXoBenchHelp)
+	  sys.exit(2)
+	for opt, arg in opts:
+	  if opt == '-h':
+		logging.info(_eXoBenchHelp)
+		sys.exit()
+	  elif opt in ("-d", "--dir"):
+		benchDir = os.path.abspath(arg)
+	  elif opt in ("-g", "--games"):
+		params["games"] = max(3, int(arg))
+	  elif opt in ("-s", "--size"):
+		params["size"] = parseSize(arg)
+	  elif opt in ("-f", "--files"):
+		params["files"] = max(1, int(arg))
+	  elif opt in ("-x", "--lb-games"):
+		params["lbgames"] = max(0, int(arg))
+	  elif opt in ("-n", "--launches"):
+		launches = max(1, int(arg))
+	  elif opt in ("-j", "--jobs"):
+		jobs = max(1, int(arg))
+	  elif opt in ("-b", "--bench"):
+		benchmarks = [benchmark.strip() for benchmark in arg.split(",") if benchmark.strip()]
+		for benchmark in benchmarks:
+			if benchmark not in _Benchmarks:
+				logging.error("Unknown benchmark '%s', use %s!", benchmark, ",".join(_Benchmarks))
+				sys.exit(2)
+	  elif opt == "--seed":
+		params["seed"] = int(arg)
+	  elif opt == "--regenerate":
+		doRegenerate = True
+
+	# Collection
+	gamenames 		= loadCollection(os.path.join(benchDir, _DataDir), params, doRegenerate)
+	runParams 		= dict(params, launches=min(launches, params["games"] - 2), jobs=jobs)
+
+	# Benchmarks
+	functions = {
+		"import" 	: benchImport,
+		"launchbox" : benchLaunchBox,
+		"cold" 		: benchColdLaunch,
+		"warm" 		: benchWarmLaunch,
+		"eviction" 	: benchEviction }
+	results = []
+	for benchmark in benchmarks:
+		logging.info("Running '%s' benchmark...", benchmark)
+		results.append((benchmark,) + functions[benchmark](benchDir, gamenames, runParams))
+
+	logging.info("Results (%s, %i games of %s) :", sys.executable, params["games"], formatSize(params["size"]))
+	for result in results:
+		reportBenchmark(*result)
+
+if __name__ == "__main__":
+	main(sys.argv[1:])
@@ -1,6 +1,7 @@
 # coding=UTF-8
 import zipfile
 from zipfile import BadZipfile
+from multiprocessing.pool import ThreadPool
 import re
 import os.path
 import os
@@ -18,7 +19,23 @@ import random
 import string
 import uuid
 import traceback
-import xml.etree.ElementTree as ET
+import hashlib
+import json
+import socket
+import signal
+import threading
+import ctypes
+if os.name == "nt":
+	import msvcrt
+else:
+	import fcntl
+import collections
+import cStringIO
+try:
+	import xml.etree.cElementTree as ET
+except ImportError:
+	import xml.etree.ElementTree as ET
+from xml.sax.saxutils import quoteattr
 
 #*****************************************************************
 # Constants
@@ -33,11 +50,42 @@ _InstallMode		= 2
 _RemoveMode			= 3
 _ImportMode			= 4
 _ImportLBMode		= 5
+_CacheStatusMode	= 6
+_PrefetchMode		= 7
+_ReindexMode		= 8
+_InstallListMode	= 9
+_RemoveListMode		= 10
+_DaemonMode			= 11
+_ScanMode			= 12
+_WarmArchivesMode	= 13
+
+# Command line
+_ShortOptions		= "hamr:i:o:l:j:"
+_LongOptions		= ["launch","install","remove","rom=","import=","outputlb=","output=","jobs=","verify","cache-status","prefetch=","prefetch-recent=","reindex","prune","timings","save-generation=","install-list=","remove-list=","daemon","no-daemon","scan=","warm-archives="]
+_PathOptions		= ["-r","--rom","-i","--import","-l","--outputlb","-o","--output","--prefetch","--install-list","--remove-list","--scan"]
+
+# Modes recorded in the stats file
+_TimedModes			= {
+	_LaunchMode 	: "launch",
+	_InstallMode 	: "install",
+	_RemoveMode 	: "remove",
+	_ImportMode 	: "import",
+	_ImportLBMode 	: "importlb",
+	_PrefetchMode 	: "prefetch",
+	_InstallListMode: "installlist",
+	_RemoveListMode	: "removelist",
+	_ScanMode		: "scan",
+	_WarmArchivesMode	: "warmarchives" }
 
 # eXo files
 _GameIni			= "game.ini"
 _GameCRC			= "game.crc"
+_GameSave			= "game.save"
+_GameBase			= "game.base"
+_GamePool			= "game.pool"
+_UpperDir			= "upper"
 _DBConf				= "dosbox.conf"
+_LaunchConf			= "eXoLauncher.conf"
 _DBMapperMap		= "mapper.map"
 
 # ini files
@@ -46,6 +94,15 @@ _CollectionKey		= "Collection"
 _GameNameKey		= "GameName"
 _ArchiveKey			= "Archive"
 _DBConfKey			= "DBConf"
+_OverridesSection	= "Overrides"
+
+# Registry
+_SlotKind			= "Slot"
+_InstallKind		= "Install"
+
+# Slot modes
+_ExtractSlotMode	= "extract"
+_OverlaySlotMode	= "overlay"
 
 # Output directories
 _GamesDir 		= "games"
@@ -60,9 +117,27 @@ _eXoDosKey 			= "!dos"
 _eXoMapperMap		= "mapper-0.74.map"
 _eXoInstallBat		= "Install.bat"
 
+# Import
+_ImportManifest		= "eXoLauncher.manifest"
+
+# Artworks
+_ArtworkExtensions	= [".jpg", ".jpeg", ".png", ".gif", ".bmp"]
+_ArtworkFormats		= { "jpg" : "JPEG", "png" : "PNG" }
+_LBArtworkSuffixes	= { _TitlesDir : "-01", _ScreensDir : "-02" }
+
+# Copy-on-write clone ioctl (Linux)
+_FICLONE			= 0x40049409
+
 # Meagre stuffs
 _Meagre				= "Meagre"
 
+# Files verification
+_CRCChunkSize		= 1024 * 1024
+
+# Windows process priority
+_ProcessModeBackgroundBegin	= 0x00100000
+_ThreadModeBackgroundBegin	= 0x00010000
+
 #*****************************************************************
 # Globals
 asciiCorrector			= re.compile(r'[^\x00-\x7F]+')
@@ -70,6 +145,11 @@ nameCleaner				= re.compile(r"\(.*\)")
 archiveNameMatcher		= re.compile(r"unzip[^\"]*\"([^\"]*)\"")
 slotsMatcher			= re.compile(r"slot(\d\d)")
 installsMatcher			= re.compile(r"install(\d\d)")
+sizeMatcher				= re.compile(r"^(\d+(?:\.\d+)?)\s*([KMGT]?)B?$", re.IGNORECASE)
+resolutionMatcher		= re.compile(r"^\s*(\d+)\s*x\s*(\d+)\s*$", re.IGNORECASE)
+mountMatcher			= re.compile(r"^\s*mount\s+([a-z]):?\s+\"?__DB_ROOT_DIR__([^\"\r\n]*)\"?", re.IGNORECASE)
+baseNameCleaner			= re.compile(r"[^\w.-]")
+imgmountMatcher			= re.compile(r"^\s*imgmount\s.*?(?:\s-t\s+(\w+))?\s*$", re.IGNORECASE)
 scriptpath 				= os.path.realpath(__file__)
 scriptdir				= os.path.dirname(scriptpath)
 scriptName, scriptExt 	= os.path.splitext(os.path.basename(scriptpath))
@@ -78,9 +158,45 @@ cfgfile 				= scriptName + ".ini"
 dbbaseconf				= os.path.join(scriptdir, _DBConf)
 workingdir 				= os.path.join(scriptdir, "_temp")
 savesdir 				= os.path.join(scriptdir, "saves")
+saveobjectsdir			= os.path.join(savesdir, "objects")
+saveslockfile			= os.path.join(savesdir, scriptName + ".lock")
+saveobjectsfile			= os.path.join(saveobjectsdir, "objects.json")
 gamesdir 				= os.path.join(scriptdir, "games")
+trashdir				= os.path.join(gamesdir, "_trash")
+basesdir 				= os.path.join(scriptdir, "bases")
+pooldir 				= os.path.join(scriptdir, "pool")
+poolfile				= os.path.join(pooldir, "pool.json")
+poollockfile			= os.path.join(pooldir, "pool.lock")
+registryfile			= os.path.join(scriptdir, scriptName + ".registry")
+historyfile				= os.path.join(scriptdir, scriptName + ".history")
+indexfile				= os.path.join(scriptdir, scriptName + ".index")
+statsfile				= os.path.join(scriptdir, scriptName + ".stats")
+exocachefile			= os.path.join(scriptdir, scriptName + ".exocache")
+gameslockfile			= os.path.join(scriptdir, scriptName + ".lock")
+daemonfile				= os.path.join(scriptdir, scriptName + ".daemon")
+socketfile				= os.path.join(scriptdir, scriptName + ".sock")
+locksdir				= os.path.join(workingdir, "locks")
 maxSlots				= 11
 maxInstalls				= 100
+extractWorkers			= 4
+slotsBudget				= 0
+artworkMaxSize			= None
+artworkFormat			= None
+artworkQuality			= 85
+Image					= None
+saveGenerations			= 3
+slotMode				= _ExtractSlotMode
+basesBudget				= 0
+poolExtensions			= [".iso", ".bin", ".cue", ".ogg", ".mp3", ".flac", ".wav", ".drv"]
+poolMinSize				= 0
+dbOverrides				= dict()
+archiveCacheDir			= ""
+archiveCacheBudget		= 0
+archiveCacheWarmup		= 10
+archivecachelockfile	= None
+daemonPort				= 0
+daemonWarmup			= 1
+isDaemon				= False
 
 #*****************************************************************
 #*****************************************************************
@@ -93,11 +209,16 @@ def timestamp():
 def id_generator(size=6, chars=string.ascii_uppercase + string.digits):
 	return ''.join(random.choice(chars) for _ in range(size))
 
-tempDirs = []
+tempDirs 		= []
+tempDirsLock	= threading.Lock()
 def mkTempDir():
-	tempDir = os.path.join(workingdir, id_generator())
-	os.makedirs(tempDir)
-	tempDirs.append(tempDir)
+	# Safe to call from import workers
+	with tempDirsLock:
+		tempDir = os.path.join(workingdir, id_generator())
+		while os.path.exists(tempDir):
+			tempDir = os.path.join(workingdir, id_generator())
+		os.makedirs(tempDir)
+		tempDirs.append(tempDir)
 	return(tempDir)
 
 def rmTree(dir):
@@ -123,7 +244,8 @@ def rmTempDir(tempDir):
 			try:
 				logging.debug("Removing dir '%r'", tempDir)
 				rmTree(tempDir)
-				tempDirs.remove(tempDir)
+				with tempDirsLock:
+					tempDirs.remove(tempDir)
 				return
 			except:
 				#Sometimes rmtree fails so we will retry 3 times
@@ -135,17 +257,72 @@ def rmTempDir(tempDir):
 			time.sleep(5)
 
 def getCRC(filename):
- filedata = open(filename, 'rb').read()
- return binascii.crc32(filedata) % 2**32
-
-def zipdir(path, ziph):
-	# ziph is zipfile handle
-	for root, dirs, files in os.walk(path):
+	# Chunked so big CD images don't get loaded in memory
+	crc = 0
+	with open(filename, 'rb') as fo:
+		while True:
+			chunk = fo.read(_CRCChunkSize)
+			if not chunk:
+				break
+			crc = binascii.crc32(chunk, crc)
+			request.timings.add(bytesRead=len(chunk))
+	return crc % 2**32
+
+def getDirSize(dir):
+	size = 0
+	for root, dirs, files in os.walk(dir):
 		for file in files:
-			absfilepath = os.path.join(root, file)
-			relfilepath = os.path.relpath(absfilepath, path)
-			logging.debug("Archiving file : " + relfilepath)
-			ziph.write(absfilepath, relfilepath)
+			size = size + os.path.getsize(os.path.join(root, file))
+	return size
+
+def parseSize(value):
+	# "700M", "1.5G", "4096"... into bytes
+	matchObj = sizeMatcher.match(value.strip())
+	if matchObj is None:
+		raise ValueError("Invalid size '%s'" % value)
+	return int(float(matchObj.group(1)) * 1024 ** " KMGT".index(matchObj.group(2).upper() or " "))
+
+def formatSize(size):
+	for unit in ["B", "KB", "MB", "GB"]:
+		if size < 1024:
+			break
+		size = size / 1024.0
+	else:
+		unit = "TB"
+	return "%.1f %s" % (size, unit)
+
+def atomicWrite(path, data):
+	# Write a temporary file then swap it with the destination
+	tmpPath = path + ".tmp"
+	with open(tmpPath, "wb") as fo:
+		fo.write(data)
+		fo.flush()
+		os.fsync(fo.fileno())
+	if os.name == "nt" and os.path.isfile(path):
+		# os.rename does not overwrite on Windows
+		os.remove(path)
+	os.rename(tmpPath, path)
+
+def jsonEncodeStrings(data):
+	# json returns unicode strings, the rest of the script uses utf-8 str
+	if isinstance(data, dict):
+		return dict((jsonEncodeStrings(key), jsonEncodeStrings(value)) for key, value in data.iteritems())
+	elif isinstance(data, list):
+		return [jsonEncodeStrings(item) for item in data]
+	elif isinstance(data, unicode):
+		return data.encode("utf-8")
+	return data
+
+def jsonRead(path):
+	# Returns None if the file is missing or corrupted
+	try:
+		with open(path, "rb") as fo:
+			return jsonEncodeStrings(json.load(fo))
+	except (IOError, ValueError):
+		return None
+
+def jsonWrite(path, data):
+	atomicWrite(path, json.dumps(data, indent=1, sort_keys=True))
 
 def searchFileInDirectories(dirs = [], filename = ""):
 	# For each directory
@@ -170,6 +347,88 @@ def xmlIndent(elem, level=0):
         if level and (not elem.tail or not elem.tail.strip()):
             elem.tail = i
 
+statsLock = threading.Lock()
+
+class Timings:
+	# Wall time, bytes read/written and files processed by each phase of a run
+	def __init__(self):
+		self.started	= time.time()
+		self.phases		= []
+		self.current	= None
+		self.since		= None
+		self.lock		= threading.Lock()
+		self.thread		= threading.current_thread()
+	
+	def start(self, name):
+		# The current phase lasts until the next one starts, phases run again add up. Workers
+		# threads are accounted in the phase of the thread running the command
+		if threading.current_thread() is not self.thread:
+			return
+		with self.lock:
+			now = time.time()
+			if self.current is not None:
+				self.current["time"] = self.current["time"] + now - self.since
+			for phase in self.phases:
+				if phase["name"] == name:
+					self.current = phase
+					break
+			else:
+				self.current = { "name" : name, "time" : 0, "read" : 0, "written" : 0, "files" : 0 }
+				self.phases.append(self.current)
+			self.since = now
+	
+	def stop(self):
+		with self.lock:
+			if self.current is not None:
+				self.current["time"] = self.current["time"] + time.time() - self.since
+				self.current = None
+	
+	def add(self, bytesRead = 0, bytesWritten = 0, files = 0):
+		with self.lock:
+			if self.current is not None:
+				self.current["read"] 	= self.current["read"] + bytesRead
+				self.current["written"] = self.current["written"] + bytesWritten
+				self.current["files"] 	= self.current["files"] + files
+	
+	def report(self):
+		logging.info("Timings :")
+		for phase in self.phases:
+			logging.info("> %-12s %8.3fs  read %10s  written %10s  %6i files", phase["name"], phase["time"], formatSize(phase["read"]), formatSize(phase["written"]), phase["files"])
+		logging.info("> %-12s %8.3fs", "total", time.time() - self.started)
+	
+	def record(self, mode, target):
+		# One JSON record per line, to track regressions over time
+		with statsLock, open(statsfile, "ab") as stats:
+			stats.write(json.dumps({
+				"timestamp" : self.started,
+				"host" 		: socket.gethostname(),
+				"version" 	: _Version,
+				"mode" 		: mode,
+				"target" 	: target,
+				"total" 	: time.time() - self.started,
+				"phases" 	: self.phases }, sort_keys=True) + "\n")
+
+class RequestState(threading.local):
+	# The settings of the command line being run. Each daemon request runs in its own thread
+	# with its own settings, the threads working for a request get them with requestThread
+	def __init__(self):
+		self.fullVerify		= False
+		self.importJobs		= 1
+		self.saveGeneration	= 0
+		self.importManifest	= None
+		self.outputNamer	= None
+		self.timings		= Timings()
+
+request = RequestState()
+
+def requestThread(function):
+	# Returns function, running with the settings of the current request in any thread
+	state = dict(request.__dict__)
+	def run(*args):
+		request.__dict__.update(state)
+		return function(*args)
+	return run
+
 #*****************************************************************
 #*****************************************************************
 # Rom Mode
@@ -188,102 +447,1310 @@ def getInfosFp(eXoIniFileFp):
 	archive		= configparser.get(_eXoLoaderSection, _ArchiveKey)
 	return(gamename, archive)
 
+def getMemberDir(gameDir, filename):
+	# Same path sanitizing as ZipFile.extract
+	parts = filename.replace('/', os.path.sep).split(os.path.sep)[:-1]
+	parts = [part for part in parts if part not in ('', os.path.curdir, os.path.pardir)]
+	return os.path.join(gameDir, *parts)
+
+def extractMembers(archivePath, gameDir, infos, indexes, poolKeys, skipped, filesStats, errors):
+	# Each worker has its own handle on the archive
+	try:
+		with zipfile.ZipFile(archivePath) as zfile:
+			for index in indexes:
+				info = infos[index]
+				if skipped[index]:
+					logging.debug(" > Skipping '%s'[%d], restored from the save", info.filename, info.CRC)
+					continue
+				if poolKeys[index] is not None:
+					filesStats[index] = os.stat(extractPoolMember(zfile, info, gameDir, poolKeys[index]))
+					continue
+				logging.debug(" > Extracting '%s'[%d]", info.filename, info.CRC)
+				filesStats[index] = os.stat(zfile.extract(info, gameDir))
+				request.timings.add(bytesRead=info.compress_size, bytesWritten=info.file_size, files=1)
+	except:
+		errors.append(sys.exc_info())
+
+def extractArchive(archivePath, gameDir, poolAll = False, savedFiles = None):
+	# Returns the [name, CRC, size, mtime] of each member, in archive order, and the [name, key]
+	# of the members linked to the pool. With poolAll, every file is pooled (never written to).
+	# Members the save will overwrite (see getSavedFiles) are not extracted, their mtime is None
+	with zipfile.ZipFile(archivePath) as zfile:
+		infos = zfile.infolist()
+	
+	# Skipped members are written once, by the save restore
+	savedFiles 	= savedFiles or dict()
+	skipped 	= [info.filename in savedFiles and not info.filename.endswith("/") and savedFiles[info.filename] != [info.CRC, info.file_size] for info in infos]
+	if any(skipped):
+		logging.info(" > %i files will be restored from the save", skipped.count(True))
+	
+	# Pre-creating the directory tree so workers don't race on it
+	dirs = set(getMemberDir(gameDir, info.filename) for info in infos)
+	for dir in sorted(dirs):
+		if not os.path.isdir(dir):
+			os.makedirs(dir)
+	
+	# Members with the same name stay together to be extracted in order
+	groups = dict()
+	for index, info in enumerate(infos):
+		groups.setdefault(info.filename, []).append(index)
+	
+	# Duplicated members are overwritten, they can't be links to the pool
+	poolKeys = [None] * len(infos)
+	for index, info in enumerate(infos):
+		if len(groups[info.filename]) == 1 and not skipped[index] and isPoolable(info, poolAll):
+			poolKeys[index] = getPoolKey(info)
+	
+	# Balancing members between workers by compressed size, biggest first
+	workers 		= max(1, min(extractWorkers, len(groups)))
+	workersIndexes	= [[] for worker in range(workers)]
+	workersSizes	= [0] * workers
+	for group in sorted(groups.values(), key=lambda group: -sum(infos[index].compress_size for index in group)):
+		worker = workersSizes.index(min(workersSizes))
+		workersIndexes[worker].extend(group)
+		workersSizes[worker] = workersSizes[worker] + sum(infos[index].compress_size for index in group)
+	
+	# Extracting
+	filesStats 	= [None] * len(infos)
+	errors		= []
+	if workers == 1:
+		extractMembers(archivePath, gameDir, infos, workersIndexes[0], poolKeys, skipped, filesStats, errors)
+	else:
+		logging.debug(" > Extracting with %i workers", workers)
+		threads = []
+		for indexes in workersIndexes:
+			thread = threading.Thread(target=requestThread(extractMembers), args=(archivePath, gameDir, infos, sorted(indexes), poolKeys, skipped, filesStats, errors))
+			thread.start()
+			threads.append(thread)
+		for thread in threads:
+			thread.join()
+	if errors:
+		raise errors[0][0], errors[0][1], errors[0][2]
+	
+	# Referencing the pooled files
+	pooledFiles = [[info.filename, key] for info, key in zip(infos, poolKeys) if key is not None]
+	acquirePoolFiles([key for filename, key in pooledFiles])
+	
+	filesCRC = [[info.filename, info.CRC, fileStat.st_size, fileStat.st_mtime] if fileStat is not None else [info.filename, info.CRC, info.file_size, None] for info, fileStat in zip(infos, filesStats)]
+	return (filesCRC, pooledFiles)
+
 def installGame(eXoFile, eXoGameName, eXoArchivePath, gameDir):
+	# gameDir must have been reserved with reserveGameDir
 	logging.info("Installing game '%s'...", eXoGameName)
-	savePath 	= os.path.join(savesdir, eXoGameName + ".zip")
+	installDir	= getPartialDir(gameDir)
 	
 	# Extracting game
+	request.timings.start("archive cache")
+	eXoArchivePath = getCachedArchive(eXoArchivePath)
 	logging.info("> Extracting game archive...")
-	with open(os.path.join(gameDir, _GameCRC), "wb") as gameCRC:
-		with zipfile.ZipFile(eXoArchivePath) as zfile:
-			for info in zfile.infolist():
-				logging.debug(" > Extracting '%s'[%d]", info.filename, info.CRC)
-				zfile.extract(info, gameDir)
-				gameCRC.write(info.filename + ";" + str(info.CRC) + "\n")
+	request.timings.start("extraction")
+	filesCRC, pooledFiles = extractArchive(eXoArchivePath, installDir, False, getSavedFiles(eXoGameName))
+	writeGamePool(os.path.join(installDir, _GamePool), pooledFiles)
+	gameSize	= sum(fileCRC[2] for fileCRC in filesCRC if not fileCRC[0].endswith("/"))
 	
 	# if there is a save
-	logging.info("> Looking for a save archive...")
-	if os.path.isfile(savePath):
-		logging.info(" > Extracting save archive...")
-		# Extract it
-		savezip = zipfile.ZipFile(savePath)
-		for info in savezip.infolist():
-			logging.debug(" > Extracting '" + info.filename + "'")
-			savezip.extract(info, gameDir)
-		savezip.close()
-	else:
-		logging.info(" > No savegame found")
+	logging.info("> Looking for a save...")
+	request.timings.start("save restore")
+	restoredFiles, sizeDelta = restoreSave(eXoGameName, installDir, filesCRC)
+	gameSize = gameSize + sizeDelta
+	
+	# Writing original CRCs & restored files
+	writeGameCRC(os.path.join(installDir, _GameCRC), filesCRC)
+	writeGameCRC(os.path.join(installDir, _GameSave), restoredFiles)
 	
 	# Extracting game.ini
 	logging.info("> Extracting 'game.ini' file...")
-	eXoFile.extract(_GameIni, gameDir)
+	request.timings.start("config")
+	eXoFile.extract(_GameIni, installDir)
 	
 	# Converting/Modifying the configuration
 	logging.info("> Creating 'dosbox.conf'...")
-	confout	= open(os.path.join(gameDir, _DBConf), "wb")
+	confout	= open(os.path.join(installDir, _DBConf), "wb")
 	for line in eXoFile.open(_DBConf):
 		newline = line
 		newline = newline.replace(r"__DB_ROOT_DIR__", gameDir)
 		confout.write(newline)
 	confout.close()
+	
+	# Publishing & registering
+	publishGame(installDir, gameDir, eXoGameName, gameSize)
+
+def installOverlayGame(eXoFile, eXoGameName, eXoArchivePath, gameDir):
+	# gameDir must have been reserved with reserveGameDir. The archive is extracted once in
+	# the bases and mounted read-only, the slot only holds what the game writes
+	logging.info("Installing game '%s' over its archive...", eXoGameName)
+	installDir	= getPartialDir(gameDir)
+	upperDir	= os.path.join(installDir, _UpperDir)
+	os.makedirs(upperDir)
+	
+	# Getting the extracted archive
+	logging.info("> Looking for the extracted game archive...")
+	request.timings.start("extraction")
+	baseName 	= getBaseName(eXoArchivePath)
+	baseInfos 	= getBase(eXoArchivePath)
+	with open(os.path.join(installDir, _GameBase), "wb") as gameBase:
+		gameBase.write(baseName)
+	
+	# if there is a save
+	logging.info("> Looking for a save...")
+	request.timings.start("save restore")
+	restoredFiles, sizeDelta = restoreSave(eXoGameName, upperDir, [list(fileCRC) for fileCRC in baseInfos["files"]])
+	writeGameCRC(os.path.join(installDir, _GameSave), restoredFiles)
+	
+	# Extracting game.ini
+	logging.info("> Extracting 'game.ini' file...")
+	request.timings.start("config")
+	eXoFile.extract(_GameIni, installDir)
+	
+	# Mounting the writable directory over each mount of the game directory
+	logging.info("> Creating 'dosbox.conf'...")
+	confout	= open(os.path.join(installDir, _DBConf), "wb")
+	for line in eXoFile.open(_DBConf):
+		confout.write(line.replace(r"__DB_ROOT_DIR__", os.path.join(basesdir, baseName)))
+		matchObj = mountMatcher.match(line)
+		if matchObj is not None:
+			subDir = matchObj.group(2).replace("\\", "/").strip("/")
+			if not os.path.isdir(os.path.join(upperDir, subDir)):
+				os.makedirs(os.path.join(upperDir, subDir))
+			confout.write("mount -t overlay %s \"%s\"%s" % (matchObj.group(1), os.path.join(gameDir, _UpperDir, subDir), line[len(line.rstrip("\r\n")):]))
+	confout.close()
+	
+	# Publishing & registering
+	publishGame(installDir, gameDir, eXoGameName, getDirSize(installDir), baseName)
+
+def publishGame(installDir, gameDir, gamename, size, base = None):
+	lockGames()
+	try:
+		loadRegistry()
+		os.rename(installDir, gameDir)
+		registerGame(gameDir, gamename, size, base=base)
+	finally:
+		unlockGames()
+
+def writeGameCRC(gameCRC, filesCRC):
+	# One line per archive member : name;CRC;size;mtime (size & mtime are empty when unknown)
+	with open(gameCRC, "wb") as gameCRCFile:
+		for filename, crc, size, mtime in filesCRC:
+			if size is None or mtime is None:
+				gameCRCFile.write("%s;%d;;\n" % (filename, crc))
+			else:
+				gameCRCFile.write("%s;%d;%d;%r\n" % (filename, crc, size, mtime))
+
+def readGameCRC(gameCRC):
+	filesCRC = dict()
+	with open(gameCRC, "rb") as gameCRCFile:
+		for line in gameCRCFile:
+			file = line.rstrip("\r\n").split(';')
+			size = mtime = None
+			# Older game.crc files only have the CRCs
+			if len(file) >= 4 and file[2]:
+				size 	= int(file[2])
+				mtime 	= float(file[3])
+			filesCRC[file[0]] = (int(file[1]), size, mtime)
+	return filesCRC
+
+def isFileUnmodified(localFile, zipFileCRC, zipFileSize, zipFileMTime):
+	# Same size & mtime as when it was extracted : no need to hash it
+	if not request.fullVerify and zipFileSize is not None:
+		fileStat = os.stat(localFile)
+		if fileStat.st_size == zipFileSize and fileStat.st_mtime == zipFileMTime:
+			return True
+	localFileCRC = getCRC(localFile)
+	#logging.info(localFile + "[" + str(localFileCRC) + "]")
+	return localFileCRC == zipFileCRC
 
 def removeGame(gameDir):
-	# Inifile
-	iniFile = os.path.join(gameDir, _GameIni)
-	if not os.path.isfile(iniFile):
+	# Uninstalls a game right away, must be called with the games lock held
+	if not os.path.isfile(os.path.join(gameDir, _GameIni)):
 		logging.error("No '%s' in '%s'! Clean manually.", _GameIni, gameDir)
 		sys.exit(1)
+	cleanTrashedGame(trashGame(gameDir))
+
+#*****************************************************************
+# Trash
+# Evicted games are renamed into the trash, their save is written and their
+# files are deleted later by a low priority thread while the new game runs.
+# Everything needed is written in a cleanup job before anything is deleted,
+# an interrupted cleanup starts over from it on the next run.
+def trashGame(gameDir):
+	# Must be called with the games lock held, renaming is instant
+	if not os.path.isdir(trashdir):
+		os.makedirs(trashdir)
+	trashedDir = os.path.join(trashdir, os.path.basename(gameDir) + "." + timestamp())
+	os.rename(gameDir, trashedDir)
+	unregisterGame(gameDir)
+	return trashedDir
+
+def getCleanupJobPath(trashedDir):
+	return trashedDir + ".json"
+
+def getTrashedGames():
+	# Trashed directories, and jobs whose directory was already deleted
+	if not os.path.isdir(trashdir):
+		return []
+	trashedDirs = set()
+	for item in os.listdir(trashdir):
+		if item.endswith(".json"):
+			item = item[:-len(".json")]
+		trashedDirs.add(os.path.join(trashdir, item))
+	return sorted(trashedDirs)
+
+def getTrashedGameName(trashedDir):
+	# game.ini is deleted once the job is written, None if the game is gone
+	try:
+		return getInfos(os.path.join(trashedDir, _GameIni))[0]
+	except (IOError, ConfigParser.Error):
+		job = jsonRead(getCleanupJobPath(trashedDir))
+		return job["game"] if job is not None else None
+
+def readCleanupJob(trashedDir):
+	# Returns None if the game can't be identified
+	jobPath = getCleanupJobPath(trashedDir)
+	job 	= jsonRead(jobPath)
+	if job is not None:
+		return job
+	iniFile 	= os.path.join(trashedDir, _GameIni)
+	gameCRC 	= os.path.join(trashedDir, _GameCRC)
+	gameSave 	= os.path.join(trashedDir, _GameSave)
+	gamePool 	= os.path.join(trashedDir, _GamePool)
+	isOverlay 	= os.path.isfile(os.path.join(trashedDir, _GameBase))
+	if not os.path.isfile(iniFile) or not (isOverlay or os.path.isfile(gameCRC)):
+		return None
+	job = {
+		"game" 		: getInfos(iniFile)[0],
+		"overlay" 	: isOverlay,
+		"files" 	: readGameCRC(gameCRC) if not isOverlay else dict(),
+		# Restored files (older installs don't have them) & files linked to the pool
+		"restored" 	: readGameCRC(gameSave) if os.path.isfile(gameSave) else dict(),
+		"pooled" 	: readGamePool(gamePool) if os.path.isfile(gamePool) else dict(),
+		"saved" 	: False,
+		"corrupted" : [] }
+	jsonWrite(jobPath, job)
+	return job
+
+def removeTrashedGame(trashedDir):
+	jobPath = getCleanupJobPath(trashedDir)
+	job 	= readCleanupJob(trashedDir)
+	if job is None:
+		logging.error("No '%s' or '%s' in '%s'! Clean manually.", _GameIni, _GameCRC, trashedDir)
+		return
+	logging.info("Removing game '%s'...", job["game"])
 	
-	# Read the info
-	gamename, archive = getInfos(iniFile)
-	logging.info("Removing game '%s'...", gamename)
+	if not job["saved"]:
+		if job["overlay"]:
+			# Nothing to compare, everything in the writable directory was written by the game
+			saveDir = os.path.join(trashedDir, _UpperDir)
+		else:
+			saveDir 		= trashedDir
+			filesCRC 		= job["files"]
+			pooledFiles 	= job["pooled"]
+			corruptedKeys 	= set()
+			
+			# Remove unmodified stuffs
+			logging.info("> Cleaning game directory...")
+			for zipFile in reversed(sorted(filesCRC.keys())):
+				localFile 	= os.path.join(trashedDir, zipFile)
+				if os.path.isfile(localFile):
+					if isFileUnmodified(localFile, *filesCRC[zipFile]):
+						logging.debug("Removing unmodified file '" + localFile + "'")
+						os.remove(localFile)
+					elif zipFile in pooledFiles and isPoolLink(localFile, pooledFiles[zipFile]):
+						# Modified in place, so was the pooled copy
+						corruptedKeys.add(pooledFiles[zipFile])
+				elif os.path.isdir(localFile):
+					if not os.listdir(localFile):
+						logging.debug("Removing unmodified dir '" + localFile + "'")
+						os.rmdir(localFile)
+			job["corrupted"] = sorted(corruptedKeys)
+			
+			# Deleting eXoLauncher files
+			for file in [_GameIni, _GameCRC, _GameSave, _GamePool, _DBConf, _LaunchConf]:
+				if os.path.isfile(os.path.join(trashedDir, file)):
+					os.remove(os.path.join(trashedDir, file))
+		
+		# If there is stuff left, directories not in the archive don't count
+		logging.info("> Saving...")
+		if any(files for root, dirs, files in os.walk(saveDir)):
+			writeSave(job["game"], saveDir, job["restored"])
+		else:
+			logging.info(" > No modified files.")
+		job["saved"] = True
+		jsonWrite(jobPath, job)
 	
-	# Verify archive
-	gameCRC = os.path.join(gameDir, _GameCRC)
-	if not gameCRC:
-		logging.error("No '%s' in '%s'! Clean manually.", _GameCRC, gameDir)
-		sys.exit(1)
+	# The pool goes last, leaking references is harmless, releasing them twice is not
+	if os.path.isdir(trashedDir):
+		rmTree(trashedDir)
+	os.remove(jobPath)
+	releasePoolFiles(job["pooled"].values(), job["corrupted"])
+
+def cleanTrashedGame(trashedDir, blocking = True):
+	# Returns False if someone else is cleaning it
+	lockPath 	= os.path.join(locksdir, "trash." + os.path.basename(trashedDir) + ".lock")
+	fd 			= lockFile(lockPath, blocking)
+	if fd is None:
+		return False
+	try:
+		if os.path.isdir(trashedDir) or os.path.isfile(getCleanupJobPath(trashedDir)):
+			removeTrashedGame(trashedDir)
+	finally:
+		unlockFile(fd)
+		try:
+			os.remove(lockPath)
+		except OSError:
+			pass
+	return True
+
+trashCleaner 		= None
+trashPending 		= False
+trashCleanerLock 	= threading.Lock()
+
+def startTrashCleaner():
+	# One cleaner thread per process, games cleaned by other processes are skipped
+	global trashCleaner, trashPending
+	with trashCleanerLock:
+		trashPending = True
+		if trashCleaner is None:
+			trashCleaner = threading.Thread(target=cleanTrash)
+			trashCleaner.start()
+
+def cleanTrash():
+	global trashCleaner, trashPending
+	lowerPriority()
+	while True:
+		with trashCleanerLock:
+			if not trashPending:
+				trashCleaner = None
+				return
+			trashPending = False
+		for trashedDir in getTrashedGames():
+			try:
+				cleanTrashedGame(trashedDir, False)
+			except:
+				logging.error("> Unable to clean '%s'!", trashedDir)
+				logging.debug(traceback.format_exc())
+
+def checkTrash(gamename):
+	# A trashed game can't be installed again before its save is written. Called before taking
+	# the games lock, then again under it before reserving a directory (removeTrashedGame doesn't
+	# take the games lock) : the game may have been trashed in between
+	trashedDirs = getTrashedGames()
+	for trashedDir in trashedDirs:
+		if getTrashedGameName(trashedDir) == gamename:
+			logging.info("> Game '%s' is being removed, waiting for its save...", gamename)
+			cleanTrashedGame(trashedDir)
+	# Cleanups interrupted by a previous run
+	if trashedDirs:
+		startTrashCleaner()
+
+#*****************************************************************
+# Pool
+# Archive members shared between games are extracted once in pool/, keyed by
+# their CRC & size, and hardlinked into the game directories. Only members
+# that are never written to (CD images, audio tracks, drivers...) are pooled,
+# a game modifying a link in place would modify every copy.
+def getPoolKey(info):
+	return "%08x-%d" % (info.CRC, info.file_size)
+
+def getPoolPath(key):
+	return os.path.join(pooldir, key[:2], key)
+
+def isPoolable(info, poolAll = False):
+	if info.filename.endswith("/") or info.file_size == 0:
+		return False
+	if poolAll:
+		return True
+	return info.file_size >= poolMinSize and os.path.splitext(info.filename)[1].lower() in poolExtensions
+
+def linkFile(source, destination):
+	# os.link is missing on Windows with python 2
+	if hasattr(os, "link"):
+		os.link(source, destination)
+	elif not ctypes.windll.kernel32.CreateHardLinkW(unicode(destination), unicode(source), None):
+		raise OSError(ctypes.GetLastError(), "Unable to link '%s'" % destination)
+
+def isPoolLink(localFile, key):
+	poolFile = getPoolPath(key)
+	if not os.path.isfile(poolFile):
+		return False
+	# No inodes on Windows with python 2, assuming the worst
+	if not hasattr(os.path, "samefile"):
+		return True
+	return os.path.samefile(localFile, poolFile)
+
+def unlinkMember(gameDir, filename):
+	# Writing into a pooled file would modify the pool
+	localFile = os.path.join(getMemberDir(gameDir, filename), os.path.basename(filename))
+	if os.path.isfile(localFile):
+		os.remove(localFile)
+
+def extractPoolMember(zfile, info, gameDir, key):
+	# Linking the pooled copy, or extracting the member and adding it to the pool
+	localFile 	= os.path.join(getMemberDir(gameDir, info.filename), os.path.basename(info.filename))
+	poolFile 	= getPoolPath(key)
+	try:
+		linkFile(poolFile, localFile)
+		logging.debug(" > Linking '%s'[%d] from the pool", info.filename, info.CRC)
+		request.timings.add(files=1)
+		return localFile
+	except OSError:
+		pass
 	
-	# Gettings original CRCs
-	logging.debug("> Gettings original CRCs from '%s'...", _GameCRC)
-	filesCRC = dict()
-	with open(gameCRC, "rb") as gameCRCFile:
-		for line in gameCRCFile:
-			file = line.split(';')
-			filesCRC[file[0]] = int(file[1])
-	
-	# Remove unmodified stuffs
-	logging.info("> Cleaning game directory...")
-	for zipFile in reversed(sorted(filesCRC.keys())):
-		localFile 	= os.path.join(gameDir,zipFile)
-		if os.path.isfile(localFile):
-			zipFileCRC		= filesCRC[zipFile]
-			localFileCRC 	= getCRC(localFile)
-			#logging.info(localFile + "[" + str(localFileCRC) + "]")
-			if localFileCRC == zipFileCRC:
-				logging.debug("Removing unmodified file '" + localFile + "'")
-				os.remove(localFile)
-		elif os.path.isdir(localFile):
-			if not os.listdir(localFile):
-				logging.debug("Removing unmodified dir '" + localFile + "'")
-				os.rmdir(localFile)
-	
-	# Deleting game.ini & dosbox.conf file
-	os.remove(iniFile)
-	os.remove(gameCRC)
-	os.remove(os.path.join(gameDir, _DBConf))
-	
-	# If there is stuff left
-	savePath 	= os.path.join(savesdir, gamename + ".zip")
-	logging.info("> Saving...")
-	if os.listdir(gameDir):
-		# Save it
-		logging.info(" > Saving modified files into '" + savePath + "'...")
-		zipf = zipfile.ZipFile(savePath, 'w')
-		zipdir(gameDir, zipf)
-		zipf.close()
+	logging.debug(" > Extracting '%s'[%d] into the pool", info.filename, info.CRC)
+	zfile.extract(info, gameDir)
+	request.timings.add(bytesRead=info.compress_size, bytesWritten=info.file_size, files=1)
+	try:
+		if not os.path.isdir(os.path.dirname(poolFile)):
+			os.makedirs(os.path.dirname(poolFile))
+		linkFile(localFile, poolFile)
+	except OSError:
+		# Added by someone else or not on the same file system
+		pass
+	return localFile
+
+def writeGamePool(gamePool, pooledFiles):
+	with open(gamePool, "wb") as gamePoolFile:
+		for filename, key in pooledFiles:
+			gamePoolFile.write("%s;%s\n" % (filename, key))
+
+def readGamePool(gamePool):
+	pooledFiles = dict()
+	with open(gamePool, "rb") as gamePoolFile:
+		for line in gamePoolFile:
+			filename, key = line.rstrip("\r\n").rsplit(';', 1)
+			pooledFiles[filename] = key
+	return pooledFiles
+
+def acquirePoolFiles(keys):
+	if not keys:
+		return
+	poolLock = lockFile(poollockfile)
+	try:
+		refcounts = jsonRead(poolfile) or dict()
+		for key in keys:
+			refcounts[key] = refcounts.get(key, 0) + 1
+		jsonWrite(poolfile, refcounts)
+	finally:
+		unlockFile(poolLock)
+
+def releasePoolFiles(keys, corruptedKeys = ()):
+	# Pooled files no one references anymore are removed, the links in the games stay valid
+	if not keys:
+		return
+	poolLock = lockFile(poollockfile)
+	try:
+		refcounts = jsonRead(poolfile) or dict()
+		for key in keys:
+			refcount = refcounts.pop(key, 0) - 1
+			if refcount > 0 and key not in corruptedKeys:
+				refcounts[key] = refcount
+			elif os.path.isfile(getPoolPath(key)):
+				logging.debug(" > Removing pooled file '%s'", key)
+				os.remove(getPoolPath(key))
+		jsonWrite(poolfile, refcounts)
+	finally:
+		unlockFile(poolLock)
+
+def getPoolUsage():
+	# Returns the number of pooled files and their size
+	refcounts = jsonRead(poolfile) or dict()
+	return (len(refcounts), sum(int(key.split("-")[1]) for key in refcounts))
+
+#*****************************************************************
+# Saves
+# Each game has a list of generations in saves/<game>.json, oldest first.
+# A generation maps the saved files to their CRC, size & content object.
+# Objects are stored once in saves/objects, named after their SHA1.
+def getSavePath(gamename):
+	return os.path.join(savesdir, gamename + ".json")
+
+def getLegacySavePath(gamename):
+	# Whole leftover dir zipped by older versions
+	return os.path.join(savesdir, gamename + ".zip")
+
+def getSaveObjectPath(key):
+	return os.path.join(saveobjectsdir, key[:2], key)
+
+def loadSaves(gamename):
+	saves = jsonRead(getSavePath(gamename))
+	if saves is None:
+		return []
+	return saves["generations"]
+
+def getSaveGeneration(gamename, generation = 0):
+	# 0 is the latest generation, 1 the previous one...
+	generations = loadSaves(gamename)
+	if generation >= len(generations):
+		return None
+	return generations[-1 - generation]
+
+def storeSaveObject(localFile):
+	# Copying the file while hashing it, the copy is dropped if the object exists
+	sha1 	= hashlib.sha1()
+	tmpPath = os.path.join(saveobjectsdir, "%s-%s.tmp" % (os.getpid(), threading.current_thread().ident))
+	with open(localFile, "rb") as fi:
+		with open(tmpPath, "wb") as fo:
+			while True:
+				chunk = fi.read(_CRCChunkSize)
+				if not chunk:
+					break
+				sha1.update(chunk)
+				fo.write(chunk)
+				request.timings.add(bytesRead=len(chunk))
+	key 		= sha1.hexdigest()
+	objectPath 	= getSaveObjectPath(key)
+	if os.path.isfile(objectPath):
+		os.remove(tmpPath)
+	else:
+		if not os.path.isdir(os.path.dirname(objectPath)):
+			os.makedirs(os.path.dirname(objectPath))
+		os.rename(tmpPath, objectPath)
+		request.timings.add(bytesWritten=os.path.getsize(objectPath), files=1)
+	return key
+
+def getGenerationsKeys(generations):
+	# One reference per saved file of each generation
+	return [savedFile[2] for generation in generations for savedFile in generation["files"].values()]
+
+def readSaveRefcounts():
+	# Must be called with the saves lock held. Counted once from the saves when missing
+	refcounts = jsonRead(saveobjectsfile)
+	if refcounts is None:
+		logging.info(" > Counting save objects references...")
+		refcounts = dict()
+		for file in os.listdir(savesdir):
+			if file.endswith(".json"):
+				saves = jsonRead(os.path.join(savesdir, file))
+				if saves is None:
+					logging.warning(" > Unreadable save '%s' -> Skipping", file)
+					continue
+				for key in getGenerationsKeys(saves["generations"]):
+					refcounts[key] = refcounts.get(key, 0) + 1
+		# Objects left unreferenced by older versions
+		for root, dirs, files in os.walk(saveobjectsdir):
+			for file in files:
+				if root != saveobjectsdir and file not in refcounts and not file.endswith(".tmp"):
+					logging.debug(" > Removing unused save object '%s'", file)
+					os.remove(os.path.join(root, file))
+	return refcounts
+
+def releaseSaveObjects(refcounts, keys):
+	# Objects no generation references anymore are removed
+	for key in keys:
+		refcount = refcounts.pop(key, 0) - 1
+		if refcount > 0:
+			refcounts[key] = refcount
+		elif os.path.isfile(getSaveObjectPath(key)):
+			logging.debug(" > Removing unused save object '%s'", key)
+			os.remove(getSaveObjectPath(key))
+
+def writeSave(gamename, gameDir, restoredFiles):
+	# Only files that changed since the last generation are stored
+	logging.info(" > Saving modified files into '%s'...", getSavePath(gamename))
+	savesLock = lockFile(saveslockfile)
+	try:
+		refcounts 		= readSaveRefcounts()
+		previous 		= getSaveGeneration(gamename)
+		previousFiles 	= previous["files"] if previous is not None else dict()
+		savedFiles 		= dict()
+		for root, dirs, files in os.walk(gameDir):
+			for file in files:
+				localFile 	= os.path.join(root, file)
+				savedFile 	= os.path.relpath(localFile, gameDir).replace(os.path.sep, "/")
+				fileStat 	= os.stat(localFile)
+				
+				# Restored and untouched since : no need to hash it
+				restored = restoredFiles.get(savedFile)
+				if not request.fullVerify and restored is not None and restored[1] == fileStat.st_size and restored[2] == fileStat.st_mtime:
+					crc = restored[0]
+				else:
+					crc = getCRC(localFile)
+				
+				previousFile = previousFiles.get(savedFile)
+				if previousFile is not None and previousFile[:2] == [crc, fileStat.st_size] and os.path.isfile(getSaveObjectPath(previousFile[2])):
+					logging.debug(" > Unchanged file '%s'", savedFile)
+					savedFiles[savedFile] = previousFile
+				else:
+					logging.debug(" > Storing file '%s'", savedFile)
+					savedFiles[savedFile] = [crc, fileStat.st_size, storeSaveObject(localFile)]
+		
+		# Adding the generation & applying retention. References are added before the save is
+		# written and released after, an interruption can only leak objects
+		generations = loadSaves(gamename)
+		generations.append({ "timestamp" : time.time(), "files" : savedFiles })
+		for key in getGenerationsKeys(generations[-1:]):
+			refcounts[key] = refcounts.get(key, 0) + 1
+		jsonWrite(saveobjectsfile, refcounts)
+		droppedGenerations = generations[:-saveGenerations]
+		del generations[:-saveGenerations]
+		jsonWrite(getSavePath(gamename), { "generations" : generations })
+		if droppedGenerations:
+			releaseSaveObjects(refcounts, getGenerationsKeys(droppedGenerations))
+			jsonWrite(saveobjectsfile, refcounts)
+		
+		# Its content is in the new generation now
+		if os.path.isfile(getLegacySavePath(gamename)):
+			os.remove(getLegacySavePath(gamename))
+	finally:
+		unlockFile(savesLock)
+
+def restoreLegacySave(savePath, installDir, filesCRC):
+	logging.info(" > Extracting save archive...")
+	restoredFiles 	= []
+	sizeDelta 		= 0
+	members 		= dict((fileCRC[0], fileCRC) for fileCRC in filesCRC)
+	with zipfile.ZipFile(savePath) as savezip:
+		for info in savezip.infolist():
+			logging.debug(" > Extracting '" + info.filename + "'")
+			unlinkMember(installDir, info.filename)
+			fileStat = os.stat(savezip.extract(info, installDir))
+			restoredFiles.append([info.filename, info.CRC, fileStat.st_size, fileStat.st_mtime])
+			sizeDelta = sizeDelta + info.file_size - (members[info.filename][2] if info.filename in members else 0)
+			request.timings.add(bytesRead=info.compress_size, bytesWritten=info.file_size, files=1)
+			
+			# Saved files must always be verified on removal
+			if info.filename in members:
+				members[info.filename][2] = members[info.filename][3] = None
+	return (restoredFiles, sizeDelta)
+
+def restoreSave(gamename, installDir, filesCRC):
+	# Returns the [name, CRC, size, mtime] of the restored files and the size they add
+	generation = getSaveGeneration(gamename, request.saveGeneration)
+	if generation is None:
+		if os.path.isfile(getLegacySavePath(gamename)):
+			return restoreLegacySave(getLegacySavePath(gamename), installDir, filesCRC)
+		logging.info(" > No savegame found")
+		return ([], 0)
+	
+	logging.info(" > Restoring save from %s...", datetime.datetime.fromtimestamp(generation["timestamp"]).strftime("%Y-%m-%d %H:%M:%S"))
+	restoredFiles 	= []
+	sizeDelta 		= 0
+	members 		= dict((fileCRC[0], fileCRC) for fileCRC in filesCRC)
+	for savedFile, (crc, size, key) in sorted(generation["files"].items()):
+		member = members.get(savedFile)
+		
+		# Same content as the extracted file
+		if member is not None and member[1] == crc and member[2] == size:
+			logging.debug(" > Skipping matching file '%s'", savedFile)
+			continue
+		
+		logging.debug(" > Restoring '%s'", savedFile)
+		localDir 	= getMemberDir(installDir, savedFile)
+		localFile 	= os.path.join(localDir, os.path.basename(savedFile))
+		if not os.path.isdir(localDir):
+			os.makedirs(localDir)
+		unlinkMember(installDir, savedFile)
+		shutil.copyfile(getSaveObjectPath(key), localFile)
+		fileStat = os.stat(localFile)
+		restoredFiles.append([savedFile, crc, fileStat.st_size, fileStat.st_mtime])
+		sizeDelta = sizeDelta + size - (member[2] if member is not None else 0)
+		request.timings.add(bytesRead=size, bytesWritten=size, files=1)
+		
+		# Saved files must always be verified on removal
+		if member is not None:
+			member[2] = member[3] = None
+	return (restoredFiles, sizeDelta)
+
+def getSavedFiles(gamename):
+	# The files restoreSave will write : name -> [CRC, size], None for any content (legacy saves)
+	generation = getSaveGeneration(gamename, request.saveGeneration)
+	if generation is not None:
+		return dict((savedFile, [crc, size]) for savedFile, (crc, size, key) in generation["files"].items())
+	if os.path.isfile(getLegacySavePath(gamename)):
+		with zipfile.ZipFile(getLegacySavePath(gamename)) as savezip:
+			return dict((info.filename, None) for info in savezip.infolist())
+	return dict()
+
+def getSaveSize(gamename):
+	generation = getSaveGeneration(gamename, request.saveGeneration)
+	if generation is not None:
+		return sum(savedFile[1] for savedFile in generation["files"].values())
+	if os.path.isfile(getLegacySavePath(gamename)):
+		with zipfile.ZipFile(getLegacySavePath(gamename)) as savezip:
+			return sum(info.file_size for info in savezip.infolist())
+	return 0
+
+#*****************************************************************
+# Bases
+# Archives extracted once for the overlay slots : bases/<archive> and its
+# infos (archive size & mtime, members, extracted size) in bases/<archive>.json.
+# Bases used by a registered slot are never evicted.
+def getBaseName(eXoArchivePath):
+	# Replaces __DB_ROOT_DIR__ in unquoted mount lines, DOSBox would split it at the first space
+	name = os.path.splitext(os.path.basename(eXoArchivePath))[0]
+	return baseNameCleaner.sub("_", name) + "-" + hashlib.sha1(name).hexdigest()[:8]
+
+def getBaseInfosPath(baseName):
+	return os.path.join(basesdir, baseName + ".json")
+
+def getBases():
+	# Returns the base names, least recently used first
+	bases = []
+	for file in os.listdir(basesdir):
+		if file.endswith(".json"):
+			bases.append((os.path.getmtime(os.path.join(basesdir, file)), file[:-len(".json")]))
+	return [baseName for lastused, baseName in sorted(bases)]
+
+def getBasesUsage():
+	return sum(jsonRead(getBaseInfosPath(baseName))["extracted"] for baseName in getBases())
+
+def removeBase(baseName):
+	baseInfos = jsonRead(getBaseInfosPath(baseName))
+	os.remove(getBaseInfosPath(baseName))
+	if os.path.isdir(os.path.join(basesdir, baseName)):
+		rmTree(os.path.join(basesdir, baseName))
+	if baseInfos is not None:
+		releasePoolFiles([key for filename, key in baseInfos.get("pooled", [])])
+
+def makeRoomForBase(baseSize, baseName):
+	# Removing least recently used bases, bases of registered slots are kept
+	if not basesBudget:
+		return
+	lockGames()
+	try:
+		usedBases 	= set(entry.get("base") for entry in loadRegistry()["dirs"].values())
+		usage 		= getBasesUsage()
+		for otherBase in getBases():
+			if usage + baseSize <= basesBudget:
+				break
+			if otherBase == baseName or otherBase in usedBases:
+				continue
+			# Being extracted by someone else
+			baseLock = lockFile(os.path.join(locksdir, "_" + otherBase + ".lock"), False)
+			if baseLock is None:
+				continue
+			try:
+				logging.info(" > Removing least recently used extracted archive '%s'...", otherBase)
+				usage = usage - jsonRead(getBaseInfosPath(otherBase))["extracted"]
+				removeBase(otherBase)
+			finally:
+				unlockFile(baseLock)
+		if usage + baseSize > basesBudget:
+			logging.warning(" > Archive needs %s, bases budget of %s exceeded!", formatSize(baseSize), formatSize(basesBudget))
+	finally:
+		unlockGames()
+
+def getBase(eXoArchivePath):
+	# Returns the base infos, extracting the archive if it's missing or outdated
+	baseName 	= getBaseName(eXoArchivePath)
+	baseDir 	= os.path.join(basesdir, baseName)
+	archiveStat = os.stat(eXoArchivePath)
+	baseLock 	= lockFile(os.path.join(locksdir, "_" + baseName + ".lock"))
+	try:
+		baseInfos = jsonRead(getBaseInfosPath(baseName))
+		if baseInfos is not None and os.path.isdir(baseDir) and baseInfos["size"] == archiveStat.st_size and baseInfos["mtime"] == archiveStat.st_mtime:
+			logging.info(" > Using extracted archive '%s'", baseDir)
+			os.utime(getBaseInfosPath(baseName), None)
+			return baseInfos
+		if baseInfos is not None:
+			logging.info(" > Extracted archive '%s' is outdated", baseDir)
+			removeBase(baseName)
+		
+		logging.info(" > Extracting game archive...")
+		with zipfile.ZipFile(eXoArchivePath) as zfile:
+			makeRoomForBase(sum(info.file_size for info in zfile.infolist()), baseName)
+		partialDir = getPartialDir(baseDir)
+		if os.path.isdir(partialDir):
+			rmTree(partialDir)
+		filesCRC, pooledFiles = extractArchive(getCachedArchive(eXoArchivePath), partialDir, True)
+		os.rename(partialDir, baseDir)
+		baseInfos = {
+			"archive" 	: eXoArchivePath,
+			"size" 		: archiveStat.st_size,
+			"mtime" 	: archiveStat.st_mtime,
+			"extracted"	: sum(fileCRC[2] for fileCRC in filesCRC if not fileCRC[0].endswith("/")),
+			"files" 	: filesCRC,
+			"pooled" 	: pooledFiles }
+		jsonWrite(getBaseInfosPath(baseName), baseInfos)
+		return baseInfos
+	finally:
+		unlockFile(baseLock)
+
+#*****************************************************************
+# Archives cache
+# Local copies of the collections archives (network shares...) : <cache>/<archive>
+# and its infos (source path, size & mtime) in <cache>/<archive>.json. Least
+# recently used archives are removed beyond the budget.
+def getCachedArchivePath(archive):
+	return os.path.join(archiveCacheDir, archive)
+
+def getCachedArchiveInfosPath(archive):
+	return getCachedArchivePath(archive) + ".json"
+
+def getCachedArchives():
+	# Returns the archive names, least recently used first
+	archives = []
+	for file in os.listdir(archiveCacheDir):
+		if file.endswith(".json"):
+			archives.append((os.path.getmtime(os.path.join(archiveCacheDir, file)), file[:-len(".json")]))
+	return [archive for lastused, archive in sorted(archives)]
+
+def getArchiveCacheUsage():
+	return sum((jsonRead(getCachedArchiveInfosPath(archive)) or { "size" : 0 })["size"] for archive in getCachedArchives())
+
+def removeCachedArchive(archive):
+	# Fails on Windows while the archive is being read
+	if os.path.isfile(getCachedArchivePath(archive)):
+		os.remove(getCachedArchivePath(archive))
+	os.remove(getCachedArchiveInfosPath(archive))
+
+def makeRoomForArchive(archiveSize, archive):
+	# Must be called with the archives cache lock held
+	usage = getArchiveCacheUsage()
+	for otherArchive in getCachedArchives():
+		if usage + archiveSize <= archiveCacheBudget:
+			break
+		if otherArchive == archive:
+			continue
+		logging.info(" > Removing least recently used cached archive '%s'...", otherArchive)
+		otherSize = (jsonRead(getCachedArchiveInfosPath(otherArchive)) or { "size" : 0 })["size"]
+		try:
+			removeCachedArchive(otherArchive)
+			usage = usage - otherSize
+		except OSError:
+			logging.info(" > Cached archive '%s' is in use, skipping it", otherArchive)
+	return usage + archiveSize <= archiveCacheBudget
+
+def copyArchive(eXoArchivePath, cachedPath):
+	partialPath = cachedPath + ".partial"
+	with open(eXoArchivePath, "rb") as fi:
+		with open(partialPath, "wb") as fo:
+			while True:
+				chunk = fi.read(_CRCChunkSize)
+				if not chunk:
+					break
+				fo.write(chunk)
+				request.timings.add(bytesRead=len(chunk), bytesWritten=len(chunk))
+	# Same size & mtime as the source, bases extracted from either stay valid
+	archiveStat = os.stat(eXoArchivePath)
+	os.utime(partialPath, (archiveStat.st_atime, archiveStat.st_mtime))
+	os.rename(partialPath, cachedPath)
+	request.timings.add(files=1)
+
+def getCachedArchive(eXoArchivePath):
+	# Returns the path to read the archive from, copying it in the cache if missing or outdated
+	if not archiveCacheDir:
+		return eXoArchivePath
+	archive 	= os.path.basename(eXoArchivePath)
+	cachedPath 	= getCachedArchivePath(archive)
+	infosPath 	= getCachedArchiveInfosPath(archive)
+	
+	# Collection unreachable, the cached copy is better than nothing
+	try:
+		archiveStat = os.stat(eXoArchivePath)
+	except OSError:
+		if os.path.isfile(cachedPath) and os.path.isfile(infosPath):
+			logging.warning(" > Archive '%s' is unreachable, using its cached copy", eXoArchivePath)
+			return cachedPath
+		return eXoArchivePath
+	
+	# Copied once, the others wait for it
+	archiveLock = lockFile(os.path.join(locksdir, "archive." + archive + ".lock"))
+	try:
+		cacheLock = lockFile(archivecachelockfile)
+		try:
+			infos = jsonRead(infosPath)
+			if infos is not None and os.path.isfile(cachedPath) and infos["source"] == eXoArchivePath and infos["size"] == archiveStat.st_size and infos["mtime"] == archiveStat.st_mtime:
+				logging.info(" > Using cached archive '%s'", cachedPath)
+				os.utime(infosPath, None)
+				return cachedPath
+			if infos is not None:
+				logging.info(" > Cached archive '%s' is outdated", cachedPath)
+				removeCachedArchive(archive)
+			if archiveCacheBudget and not makeRoomForArchive(archiveStat.st_size, archive):
+				logging.warning(" > Archive needs %s, archives cache budget of %s exceeded!", formatSize(archiveStat.st_size), formatSize(archiveCacheBudget))
+				return eXoArchivePath
+		finally:
+			unlockFile(cacheLock)
+		
+		logging.info(" > Copying archive '%s' into the cache...", eXoArchivePath)
+		copyArchive(eXoArchivePath, cachedPath)
+		jsonWrite(infosPath, {
+			"source" 	: eXoArchivePath,
+			"size" 		: archiveStat.st_size,
+			"mtime" 	: archiveStat.st_mtime })
+		return cachedPath
+	finally:
+		unlockFile(archiveLock)
+
+def eXoWarmArchives(eXoFileNames):
+	# Caching the archives of the given eXo files, the last one ends up the most recently used
+	if not archiveCacheDir:
+		logging.error("No archives cache configured (ArchiveCache)!")
+		return
+	logging.info("Caching the archives of %i eXo files...", len(eXoFileNames))
+	request.timings.start("archive cache")
+	lowerPriority()
+	for eXoFileName in eXoFileNames:
+		logging.info("Caching the archive of eXo file '%s'...", eXoFileName)
+		try:
+			eXoFile, gamename, archive = geteXoInfos(eXoFileName)
+			archivepath = getArchivePath(archive)
+		except SystemExit:
+			logging.warning("> Invalid eXo file '%s' -> Skipping", eXoFileName)
+			continue
+		getCachedArchive(archivepath)
+
+#*****************************************************************
+# DOSBox configuration
+# The base dosbox.conf, the game one and the overrides of eXoLauncher.ini are
+# merged in the game directory, rebuilt only when one of them changes.
+def getOverrides(gamename):
+	# [section, key, value] from [Overrides] then [Overrides.<GameName>]
+	return dbOverrides.get(None, []) + dbOverrides.get(gamename, [])
+
+def readDBConf(lines, dbConf):
+	# Settings are stored by section, autoexec lines are appended
+	section = None
+	for line in lines:
+		stripped = line.strip()
+		if stripped.startswith("[") and stripped.endswith("]"):
+			section = stripped[1:-1].strip().lower()
+			dbConf.setdefault(section, [] if section == "autoexec" else collections.OrderedDict())
+		elif section == "autoexec":
+			dbConf[section].append(line.rstrip("\r\n"))
+		elif section is not None and "=" in stripped and not stripped.startswith("#"):
+			key, value = stripped.split("=", 1)
+			dbConf[section][key.strip().lower()] = value.strip()
+	return dbConf
+
+def writeDBConf(dbConf, header):
+	lines = [header]
+	for section, settings in dbConf.iteritems():
+		if section != "autoexec":
+			lines.append("[%s]" % section)
+			lines.extend("%s=%s" % (key, value) for key, value in settings.iteritems())
+			lines.append("")
+	lines.append("[autoexec]")
+	lines.extend(dbConf.get("autoexec", []))
+	return "\n".join(lines) + "\n"
+
+def getLaunchConf(gameDir, gamename):
+	# Returns the merged configuration of a game
+	launchConf 	= os.path.join(gameDir, _LaunchConf)
+	gameDBConf 	= os.path.join(gameDir, _DBConf)
+	overrides 	= getOverrides(gamename)
+	
+	# Identified by the hash of everything it's made of
+	sha1 = hashlib.sha1()
+	for path in [dbbaseconf, gameDBConf]:
+		with open(path, "rb") as fo:
+			sha1.update(fo.read())
+		sha1.update("\0")
+	sha1.update(gameDir)
+	sha1.update(repr(overrides))
+	header = "# %s %s" % (_Name, sha1.hexdigest())
+	if os.path.isfile(launchConf):
+		with open(launchConf, "rb") as fo:
+			if fo.readline().rstrip("\r\n") == header:
+				logging.debug("> Using cached configuration '%s'", launchConf)
+				return launchConf
+	
+	logging.info("> Merging DOSBox configurations...")
+	dbConf = collections.OrderedDict()
+	for path in [dbbaseconf, gameDBConf]:
+		with open(path, "rb") as fo:
+			readDBConf(fo, dbConf)
+	for section, key, value in overrides:
+		logging.debug(" > Overriding [%s] %s=%s", section, key, value)
+		dbConf.setdefault(section, collections.OrderedDict())[key] = value
+	atomicWrite(launchConf, writeDBConf(dbConf, header))
+	return launchConf
+
+#*****************************************************************
+# Locking
+gamesLock 		= None
+gamesLockDepth 	= 0
+gamesThreadLock	= threading.RLock()
+slotsLocks		= dict()
+
+def lockFile(path, blocking = True):
+	# Exclusive lock, released by the OS if the process dies. Returns None if already locked
+	fd = os.open(path, os.O_RDWR | os.O_CREAT)
+	while True:
+		try:
+			if os.name == "nt":
+				msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+			else:
+				fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+			return fd
+		except IOError:
+			if not blocking:
+				os.close(fd)
+				return None
+			time.sleep(0.2)
+
+def unlockFile(fd):
+	if os.name == "nt":
+		msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
 	else:
-		logging.info(" > No modified files.")
+		fcntl.flock(fd, fcntl.LOCK_UN)
+	os.close(fd)
+
+def lockGames():
+	# Protects the registry and the games directory layout, reentrant
+	global gamesLock, gamesLockDepth, registry
+	gamesThreadLock.acquire()
+	if gamesLockDepth == 0:
+		gamesLock = lockFile(gameslockfile)
+		# Another process may have updated the registry
+		if getFileStamp(registryfile) != registryStamp:
+			registry = None
+	gamesLockDepth = gamesLockDepth + 1
+
+def unlockGames():
+	global gamesLock, gamesLockDepth
+	gamesLockDepth = gamesLockDepth - 1
+	if gamesLockDepth == 0:
+		unlockFile(gamesLock)
+		gamesLock = None
+	gamesThreadLock.release()
+
+def lockSlot(dir, blocking = True):
+	# Held while a game directory is being installed or played
+	fd = lockFile(os.path.join(locksdir, dir + ".lock"), blocking)
+	if fd is None:
+		return False
+	slotsLocks[dir] = fd
+	return True
+
+def unlockSlot(dir):
+	unlockFile(slotsLocks.pop(dir))
+
+def lowerPriority():
+	# Background tasks must not slow down a running game. In the daemon only the
+	# calling thread is lowered (os.nice is per thread on Linux)
+	try:
+		if os.name == "nt":
+			if isinstance(threading.current_thread(), threading._MainThread):
+				ctypes.windll.kernel32.SetPriorityClass(ctypes.windll.kernel32.GetCurrentProcess(), _ProcessModeBackgroundBegin)
+			else:
+				ctypes.windll.kernel32.SetThreadPriority(ctypes.windll.kernel32.GetCurrentThread(), _ThreadModeBackgroundBegin)
+		else:
+			os.nice(19)
+	except (OSError, AttributeError):
+		logging.debug("Unable to lower process priority")
+
+#*****************************************************************
+# Collections index
+collectionsIndex 		= None
+collectionsIndexLock 	= threading.Lock()
+
+def indexCollection(collection):
+	files = dict()
+	for item in os.listdir(collection):
+		path = os.path.join(collection, item)
+		if os.path.isfile(path):
+			fileStat = os.stat(path)
+			files[item] = [fileStat.st_size, fileStat.st_mtime]
+	return { "mtime" : os.path.getmtime(collection), "files" : files }
+
+def loadCollectionsIndex(forceRebuild = False):
+	# Loaded once per process (daemon, import), a collection is only indexed again when its directory mtime changed
+	global collectionsIndex
+	with collectionsIndexLock:
+		if collectionsIndex is not None and not forceRebuild:
+			return collectionsIndex
+		index = collectionsIndex or jsonRead(indexfile) or { "collections" : dict() }
+		isModified = False
+		for collection in eXoCollections:
+			if os.path.isdir(collection):
+				entry = index["collections"].get(collection)
+				if forceRebuild or entry is None or entry["mtime"] != os.path.getmtime(collection):
+					logging.info("> Indexing collection '%s'...", collection)
+					index["collections"][collection] = indexCollection(collection)
+					isModified = True
+		if isModified:
+			jsonWrite(indexfile, index)
+		collectionsIndex = index
+		return collectionsIndex
+
+def findArchive(archive):
+	# A single launch probes the collections, loading the whole index would cost more
+	index = collectionsIndex
+	if index is not None:
+		# Collections order matters, the first one having the archive wins
+		for collection in eXoCollections:
+			entry = index["collections"].get(collection)
+			if entry is not None and archive in entry["files"]:
+				path = os.path.join(collection, archive)
+				# Removed since the index was loaded
+				if os.path.isfile(path):
+					return path
+				break
+	# Not indexed (added since, different case, sub directory...)
+	return searchFileInDirectories(eXoCollections, archive)
+
+def eXoReindex():
+	logging.info("Indexing collections...")
+	index = loadCollectionsIndex(True)
+	for collection in eXoCollections:
+		entry = index["collections"].get(collection)
+		if entry is None:
+			logging.warning("> Collection '%s' not found!", collection)
+		else:
+			logging.info("> Collection '%s' : %i files", collection, len(entry["files"]))
+
+#*****************************************************************
+# Games registry
+registry 		= None
+registryStamp 	= None
+
+def getFileStamp(path):
+	# Changes whenever the file is written
+	try:
+		fileStat = os.stat(path)
+		return (fileStat.st_mtime, fileStat.st_size)
+	except OSError:
+		return None
+
+def getPartialDir(gameDir):
+	# Games are installed here then renamed, no one ever sees a half-extracted game
+	return os.path.join(os.path.dirname(gameDir), "_" + os.path.basename(gameDir) + ".partial")
+
+def scanGames(matcher, kind):
+	# Read the game.ini of every directory of a kind
+	games = dict()
+	for dir in os.listdir(gamesdir):
+		item = os.path.join(gamesdir, dir)
+		if os.path.isdir(item):
+			matchObj = matcher.match(dir)
+			if matchObj is not None:
+				id 	= int(matchObj.group(1))
+				iniFile = os.path.join(item, _GameIni)
+				if not os.path.isfile(iniFile):
+					logging.error("Invalid %s[%i] : No 'game.ini' in '%s'! Clean manually.)", kind, id, item)
+					sys.exit(1)
+				gamename, archive = getInfos(iniFile)
+				logging.debug("%s[%i] - %s", kind, id, gamename)
+				games[dir] = {
+					"game" 		: gamename,
+					"kind" 		: kind,
+					"id" 		: id,
+					"lastused" 	: os.path.getmtime(item),
+					"size" 		: getDirSize(item) }
+				if os.path.isfile(os.path.join(item, _GameBase)):
+					with open(os.path.join(item, _GameBase), "rb") as gameBase:
+						games[dir]["base"] = gameBase.read()
+	return games
+
+def saveRegistry():
+	global registryStamp
+	registry["mtime"] = os.path.getmtime(gamesdir)
+	jsonWrite(registryfile, registry)
+	registryStamp = getFileStamp(registryfile)
+
+def rebuildRegistry():
+	global registry
+	lockGames()
+	try:
+		logging.info("> Rebuilding games registry...")
+		previous = jsonRead(registryfile) or dict()
+		registry = dict()
+		registry["dirs"] = scanGames(slotsMatcher, _SlotKind)
+		registry["dirs"].update(scanGames(installsMatcher, _InstallKind))
+		# Installations in progress are not visible on disk yet
+		for dir, entry in previous.get("dirs", dict()).iteritems():
+			if entry.get("pending") and os.path.isdir(getPartialDir(os.path.join(gamesdir, dir))):
+				registry["dirs"][dir] = entry
+		saveRegistry()
+	finally:
+		unlockGames()
+
+def loadRegistry():
+	global registry, registryStamp
+	# While the games lock is held, only we can change the games directory
+	if registry is not None and gamesLockDepth > 0:
+		return registry
+	
+	# The registry is stale as soon as the games directory changed behind our back
+	mtime = os.path.getmtime(gamesdir)
+	if registry is None or registry["mtime"] != mtime:
+		registryStamp 	= getFileStamp(registryfile)
+		registry 		= jsonRead(registryfile)
+		if registry is None or registry.get("mtime") != mtime or "dirs" not in registry:
+			rebuildRegistry()
+	return registry
+
+def findRegisteredGame(gamename, kind = None):
+	# Returns the directory name of a game (installs have priority over slots)
+	for retry in range(2):
+		found = None
+		for dir, entry in loadRegistry()["dirs"].iteritems():
+			if entry["game"] == gamename and kind in (None, entry["kind"]):
+				if found is None or entry["kind"] == _InstallKind:
+					found = dir
+		if found is None or registry["dirs"][found].get("pending"):
+			return found
+		if os.path.isfile(os.path.join(gamesdir, found, _GameIni)):
+			return found
+		# A game directory was modified in place
+		rebuildRegistry()
+
+def registerGame(gameDir, gamename, size, pending = False, base = None):
+	dir 	= os.path.basename(gameDir)
+	kind	= _SlotKind
+	matchObj = slotsMatcher.match(dir)
+	if matchObj is None:
+		kind	 = _InstallKind
+		matchObj = installsMatcher.match(dir)
+	lockGames()
+	try:
+		logging.debug("Registering %s[%i] - %s", kind, int(matchObj.group(1)), gamename)
+		loadRegistry()["dirs"][dir] = {
+			"game" 		: gamename,
+			"kind" 		: kind,
+			"id" 		: int(matchObj.group(1)),
+			"lastused" 	: time.time(),
+			"size" 		: size,
+			"pending"	: pending }
+		if base is not None:
+			registry["dirs"][dir]["base"] = base
+		saveRegistry()
+	finally:
+		unlockGames()
+
+def unregisterGame(gameDir):
+	lockGames()
+	try:
+		loadRegistry()["dirs"].pop(os.path.basename(gameDir), None)
+		saveRegistry()
+	finally:
+		unlockGames()
+
+def touchGame(dir):
+	lockGames()
+	try:
+		loadRegistry()["dirs"][dir]["lastused"] = time.time()
+		saveRegistry()
+	finally:
+		unlockGames()
+
+def reserveGameDir(gameDir, gamename, size, base = None):
+	# Must be called with the games lock held, the directory stays locked until unlockSlot
+	lockSlot(os.path.basename(gameDir))
+	partialDir = getPartialDir(gameDir)
+	if os.path.isdir(partialDir):
+		rmTree(partialDir)
+	os.makedirs(partialDir)
+	registerGame(gameDir, gamename, size, True, base)
+
+def abortGameDir(gameDir):
+	# Drops a reserved directory whose installation failed, the daemon would hold its lock forever
+	if os.path.isdir(getPartialDir(gameDir)):
+		rmTree(getPartialDir(gameDir))
+	unregisterGame(gameDir)
+	unlockSlot(os.path.basename(gameDir))
+
+def cleanPendingGames():
+	# Must be called with the games lock held, drops installations of dead processes
+	for dir, entry in loadRegistry()["dirs"].items():
+		if entry.get("pending") and lockSlot(dir, False):
+			logging.warning("> Cleaning interrupted installation of '%s' in %s[%i]", entry["game"], entry["kind"], entry["id"])
+			partialDir = getPartialDir(os.path.join(gamesdir, dir))
+			if os.path.isdir(partialDir):
+				rmTree(partialDir)
+			unregisterGame(os.path.join(gamesdir, dir))
+			unlockSlot(dir)
 
 def findFreeInstall(installedGames):
 	# Find a free slot
@@ -302,119 +1769,362 @@ def getInstallName(slot):
 	
 def getSlotName(slot):
 	return "slot" + str(slot).rjust(2,'0')
-	
+
+def getRegisteredGames(kind):
+	games = dict()
+	for dir, entry in loadRegistry()["dirs"].iteritems():
+		if entry["kind"] == kind:
+			games[dir] = entry["id"]
+	return games
+
 def getInstalledGames():
-	installedGames 	= dict()
-	for dir in os.listdir(gamesdir):
-		item = os.path.join(gamesdir, dir)
-		if os.path.isdir(item):
-			matchObj = installsMatcher.match(dir)
-			if matchObj is not None:
-				id 	= int(matchObj.group(1))
-				iniFile = os.path.join(item, _GameIni)
-				if not os.path.isfile(iniFile):
-					logging.error("Invalid Install[%i] : No 'game.ini' in '%s'! Clean manually.)", id, item)
-					sys.exit(1)
-				gamename, archive = getInfos(iniFile)
-				logging.debug("Install[%i] - %s", id, gamename)
-				installedGames[gamename] 	= id
-	return installedGames
+	return getRegisteredGames(_InstallKind)
 	
 def getSlotedGames():
-	slotedGames 	= dict()
-	for dir in os.listdir(gamesdir):
-		item = os.path.join(gamesdir, dir)
-		if os.path.isdir(item):
-			matchObj = slotsMatcher.match(dir)
-			if matchObj is not None:
-				id 	= int(matchObj.group(1))
-				iniFile = os.path.join(item, _GameIni)
-				if not os.path.isfile(iniFile):
-					logging.error("Invalid Slot[%i] : No 'game.ini' in '%s'! Clean manually.)", id, item)
-					sys.exit(1)
-				gamename, archive = getInfos(iniFile)
-				logging.debug("Slot[%i] - %s", id, gamename)
-				slotedGames[gamename] 	= id
-	return slotedGames
+	return getRegisteredGames(_SlotKind)
 
-def getGame(eXoFile, eXoGameName, eXoArchivePath):
-	logging.info("Looking for game '%s'...", eXoGameName)
+def getGameSize(eXoGameName, eXoArchivePath):
+	# Uncompressed size of the game archive and its save
+	gameSize = getSaveSize(eXoGameName)
+	if os.path.isfile(eXoArchivePath):
+		with zipfile.ZipFile(eXoArchivePath) as zfile:
+			gameSize = gameSize + sum(info.file_size for info in zfile.infolist())
+	return gameSize
+
+def getFreeSpace(dir):
+	# Returns None when unknown
+	if os.name == "nt":
+		freeSpace = ctypes.c_ulonglong(0)
+		if not ctypes.windll.kernel32.GetDiskFreeSpaceExW(unicode(dir), None, None, ctypes.byref(freeSpace)):
+			return None
+		return freeSpace.value
+	stat = os.statvfs(dir)
+	return stat.f_bavail * stat.f_frsize
+
+def getSlotsUsage():
+	return sum(entry["size"] for entry in loadRegistry()["dirs"].values() if entry["kind"] == _SlotKind)
+
+def getEvictionOrder():
+	# Least recently launched slots first
+	slots = [(entry["lastused"], dir) for dir, entry in loadRegistry()["dirs"].iteritems() if entry["kind"] == _SlotKind]
+	return [dir for lastused, dir in sorted(slots)]
+
+def makeRoomForGame(gameSize, protectedDirs = None):
+	# Must be called with the games lock held. Uninstalling slots until one is free and the game fits in the
+	# budget. When prefetching (protectedDirs is not None), nothing is uninstalled unless the game then fits
+	
+	# Evicting games won't make a game bigger than the whole budget fit, only a free slot is needed then
+	budget = slotsBudget
+	if budget and gameSize > budget:
+		logging.warning("> Game needs %s, more than the whole slots budget of %s!", formatSize(gameSize), formatSize(budget))
+		if protectedDirs is not None:
+			return False
+		budget = 0
+	
+	# Picking the slots to uninstall, they're locked until trashed
+	usage 		= getSlotsUsage()
+	slotsCount 	= len(getSlotedGames())
+	evictedDirs = []
+	for dir in getEvictionOrder():
+		if slotsCount < maxSlots - 1 and not (budget and usage + gameSize > budget):
+			break
+		entry = registry["dirs"][dir]
+		if protectedDirs is not None and dir in protectedDirs:
+			continue
+		# Games being played or installed can't be evicted
+		if not lockSlot(dir, False):
+			logging.info("> Slot[%i] - %s is in use, skipping it", entry["id"], entry["game"])
+			continue
+		evictedDirs.append(dir)
+		usage 		= usage - entry["size"]
+		slotsCount 	= slotsCount - 1
+	hasRoom = slotsCount < maxSlots - 1 and not (budget and usage + gameSize > budget)
+	if not hasRoom and protectedDirs is not None:
+		for dir in evictedDirs:
+			unlockSlot(dir)
+		return False
+	
+	# Uninstalling
+	for dir in evictedDirs:
+		entry = registry["dirs"][dir]
+		logging.info("> Uninstalling least recently launched Slot[%i] - %s (%s)...", entry["id"], entry["game"], formatSize(entry["size"]))
+		request.timings.start("eviction")
+		try:
+			trashGame(os.path.join(gamesdir, dir))
+		finally:
+			unlockSlot(dir)
+	if evictedDirs:
+		startTrashCleaner()
+	if budget and usage + gameSize > budget:
+		logging.warning("> Game needs %s, slots budget of %s exceeded!", formatSize(gameSize), formatSize(budget))
+	return hasRoom
+
+def updateGameSize(gameDir):
+	# Games write files while running
+	lockGames()
+	try:
+		dir = os.path.basename(gameDir)
+		if dir in loadRegistry()["dirs"]:
+			registry["dirs"][dir]["size"] = getDirSize(gameDir)
+			saveRegistry()
+	finally:
+		unlockGames()
+
+def eXoCacheStatus():
+	# Other daemon requests may be changing the registry
+	lockGames()
+	try:
+		loadRegistry()
+		slotedGames = getSlotedGames()
+		logging.info("Slots : %i/%i used, %s", len(slotedGames), maxSlots - 1, formatSize(getSlotsUsage()))
+		if slotsBudget:
+			logging.info("Budget : %s", formatSize(slotsBudget))
+		else:
+			logging.info("Budget : unlimited")
+		logging.info("Eviction order :")
+		for dir in getEvictionOrder():
+			entry = registry["dirs"][dir]
+			logging.info("> Slot[%i] - %s - %s - last launched %s", entry["id"], entry["game"], formatSize(entry["size"]), time.ctime(entry["lastused"]))
+	finally:
+		unlockGames()
+	
+	# Evicted games being cleaned
+	trashedDirs = getTrashedGames()
+	if trashedDirs:
+		logging.info("Trash : %i games to clean", len(trashedDirs))
+	
+	# Files shared between games
+	pooledCount, pooledSize = getPoolUsage()
+	logging.info("Pool : %i files, %s", pooledCount, formatSize(pooledSize))
 	
-	# Gathering installed games
-	logging.info("> Looking for a manual installation of game '%s'...", eXoGameName)
-	installedGames 	= getInstalledGames()
-	if eXoGameName in installedGames.keys():
-		id = installedGames[eXoGameName]
-		logging.info("> Game '%s' is installed in Install[%i]", eXoGameName, id)
-		return os.path.join(gamesdir, getInstallName(id))
-	
-	# Gathering games in slots
-	logging.info("> Looking for an automatic installation of game '%s'...", eXoGameName)
-	slotedGames 	= getSlotedGames()
-	if eXoGameName in slotedGames.keys():
-		id = slotedGames[eXoGameName]
-		logging.info("> Game '%s' is installed in Slot[%i]", eXoGameName, id)
-		return os.path.join(gamesdir, getSlotName(id))
-	
-	# Find a free slot or uninstall game to get one
+	# Local copies of the archives
+	if archiveCacheDir:
+		logging.info("Cached archives : %i, %s (budget : %s)", len(getCachedArchives()), formatSize(getArchiveCacheUsage()), formatSize(archiveCacheBudget) if archiveCacheBudget else "unlimited")
+	
+	# Extracted archives of the overlay slots
+	bases = getBases()
+	if bases:
+		logging.info("Extracted archives : %i, %s (budget : %s)", len(bases), formatSize(getBasesUsage()), formatSize(basesBudget) if basesBudget else "unlimited")
+		for baseName in bases:
+			logging.info("> %s - %s - last used %s", baseName, formatSize(jsonRead(getBaseInfosPath(baseName))["extracted"]), time.ctime(os.path.getmtime(getBaseInfosPath(baseName))))
+
+def getGameSlotMode(eXoFile):
+	# DOSBox writes into floppy & hard disk images in place, they can't be shared by an overlay slot
+	if slotMode == _OverlaySlotMode:
+		for line in eXoFile.open(_DBConf):
+			matchObj = imgmountMatcher.match(line)
+			if matchObj is not None and (matchObj.group(1) or "hdd").lower() not in ["iso", "cdrom"]:
+				logging.info("> Game mounts writable disk images, it is extracted in its slot")
+				return _ExtractSlotMode
+	return slotMode
+
+def reserveSlot(eXoGameName, eXoArchivePath, protectedDirs, gameSlotMode):
+	# Must be called with the games lock held
 	logging.info("> Game '%s' is not installed. Automatic installation in a free slot...", eXoGameName)
-	slot = findFreeSlot(slotedGames)
+	checkTrash(eXoGameName)
+	base 		= None
+	if gameSlotMode == _OverlaySlotMode:
+		# The extracted archive is in the bases
+		base 		= getBaseName(eXoArchivePath)
+		gameSize 	= getSaveSize(eXoGameName)
+	else:
+		gameSize 	= getGameSize(eXoGameName, eXoArchivePath)
+	hasRoom 	= makeRoomForGame(gameSize, protectedDirs)
+	slot 		= findFreeSlot(getSlotedGames())
+	if protectedDirs is not None and not hasRoom:
+		logging.info("> No room left for game '%s'", eXoGameName)
+		return
 	if slot is None:
-		modifedSlots = dict()
-		logging.info("> No empty slot, uninstalling oldest not modified game...")
-		# Recovering modifications times
-		for slot in slotedGames.values():
-			modificationTime = os.path.getmtime(os.path.join(gamesdir, getSlotName(slot)))
-			logging.debug("Slot[%i] - %s", slot, time.ctime(modificationTime))
-			modifedSlots[modificationTime] = slot
-		
-		# Uninstalling oldest
-		slot = modifedSlots[sorted(modifedSlots.keys())[0]]
-		logging.info("> Uninstalling Slot[%i] - %s...", slot, getSlotName(slot))
-		removeGame(os.path.join(gamesdir, getSlotName(slot)))
-		rmTree(os.path.join(gamesdir, getSlotName(slot)))
-		
-	# Install game
+		logging.error("> No slot available, all slots are in use!")
+		sys.exit(1)
+	
 	logging.info("> Game '%s' will be installed in Slot[%i]", eXoGameName, slot)
 	slotDir = os.path.join(gamesdir, getSlotName(slot))
-	os.makedirs(slotDir)
-	installGame(eXoFile, eXoGameName, eXoArchivePath, slotDir)
+	reserveGameDir(slotDir, eXoGameName, gameSize, base)
 	return slotDir
+
+def getGame(eXoFile, eXoGameName, eXoArchivePath, protectedDirs = None):
+	# Returns the game directory, locked until unlockSlot. When prefetching (protectedDirs is
+	# not None), returns None instead of evicting a protected slot or exceeding the budget
+	logging.info("Looking for game '%s'...", eXoGameName)
+	request.timings.start("registry")
+	checkTrash(eXoGameName)
+	while True:
+		lockGames()
+		try:
+			cleanPendingGames()
+			
+			# Find a free slot or uninstall games to get one
+			dir = findRegisteredGame(eXoGameName)
+			if dir is None:
+				gameSlotMode 	= getGameSlotMode(eXoFile)
+				slotDir 		= reserveSlot(eXoGameName, eXoArchivePath, protectedDirs, gameSlotMode)
+				if slotDir is None:
+					return
+				break
+			
+			# Installed and not in use
+			if lockSlot(dir, False):
+				entry = registry["dirs"][dir]
+				logging.info("> Game '%s' is installed in %s[%i]", eXoGameName, entry["kind"], entry["id"])
+				touchGame(dir)
+				return os.path.join(gamesdir, dir)
+		finally:
+			unlockGames()
+		
+		# Being installed by someone else or already running
+		logging.info("> Game '%s' is in use, waiting for it...", eXoGameName)
+		lockSlot(dir)
+		unlockSlot(dir)
 	
-def geteXoInfos(eXoFileName):
-	# Verify eXo file
-	if not os.path.isfile(eXoFileName):
-		logging.error("Invalid eXo file '%s'!", eXoFileName)
-		logging.info(_eXoLauncherHelp)
-		sys.exit(1)
+	# Install game
+	try:
+		if gameSlotMode == _OverlaySlotMode:
+			installOverlayGame(eXoFile, eXoGameName, eXoArchivePath, slotDir)
+		else:
+			installGame(eXoFile, eXoGameName, eXoArchivePath, slotDir)
+	except:
+		excInfo = sys.exc_info()
+		logging.error("> Installing game '%s' failed!", eXoGameName)
+		abortGameDir(slotDir)
+		raise excInfo[0], excInfo[1], excInfo[2]
+	return slotDir
+	
+#*****************************************************************
+# eXo files cache
+# The game name & archive of each eXo file, by absolute path with its size & mtime. Filled
+# by --scan and used by the daemon only : loading it costs more than reading one eXo file
+eXoCache 		= None
+eXoCacheStamp	= None
+eXoCacheLock 	= threading.Lock()
+
+class LazyeXoFile:
+	# Opens the eXo file on first use only, launching an installed game never needs it
+	def __init__(self, eXoFileName):
+		self.eXoFileName 	= eXoFileName
+		self.eXoFile 		= None
 	
-	# Open eXo file
+	def __getattr__(self, name):
+		if self.eXoFile is None:
+			self.eXoFile = zipfile.ZipFile(self.eXoFileName)
+		return getattr(self.eXoFile, name)
+
+def getCachedeXoInfos(eXoFileName, fileStat):
+	# Returns (gamename, archive) if the eXo file didn't change since it was cached
+	global eXoCache, eXoCacheStamp
+	with eXoCacheLock:
+		# Another process may have scanned
+		stamp = getFileStamp(exocachefile)
+		if eXoCache is None or stamp != eXoCacheStamp:
+			eXoCache 		= jsonRead(exocachefile) or dict()
+			eXoCacheStamp 	= stamp
+		entry = eXoCache.get(os.path.abspath(eXoFileName))
+	if entry is not None and entry[0] == fileStat.st_size and entry[1] == fileStat.st_mtime:
+		return (entry[2], entry[3])
+
+def updateeXoCache(entries, removedFiles = ()):
+	# Merged with the cache on disk, other processes may have updated it
+	global eXoCache, eXoCacheStamp
+	with eXoCacheLock:
+		eXoCache = jsonRead(exocachefile) or dict()
+		eXoCache.update(entries)
+		for eXoFileName in removedFiles:
+			eXoCache.pop(eXoFileName, None)
+		jsonWrite(exocachefile, eXoCache)
+		eXoCacheStamp = getFileStamp(exocachefile)
+
+def addeXoCacheEntry(eXoFileName, entry):
+	# Kept in memory until the next scan, the whole cache isn't rewritten for one eXo file
+	with eXoCacheLock:
+		if eXoCache is not None:
+			eXoCache[os.path.abspath(eXoFileName)] = entry
+
+def readeXoInfos(eXoFileName):
+	# Returns the opened eXo file, its game name and archive. Raises ValueError if invalid
 	try:
 		eXoFile = zipfile.ZipFile(eXoFileName)
 		eXoFile.getinfo(_GameIni)
 		eXoFile.getinfo(_DBConf)
 	except (BadZipfile, KeyError):
-		logging.error("File '%s' does not seems to be a valid eXo file!", eXoFileName)
-		sys.exit(1)
+		raise ValueError("File '%s' does not seems to be a valid eXo file!" % eXoFileName)
 
 	# Reading config
 	gamename, archive = getInfosFp(eXoFile.open(_GameIni))
 
 	if gamename is None:
-		logging.error("Invalid Game Name. Contact your guru!")
-		sys.exit(1)
+		raise ValueError("Invalid Game Name. Contact your guru!")
 
 	if archive is None:
-		logging.error("Invalid Archive. Contact your guru!")
+		raise ValueError("Invalid Archive. Contact your guru!")
+	return eXoFile, gamename, archive
+
+def geteXoInfos(eXoFileName):
+	# Verify eXo file
+	if not os.path.isfile(eXoFileName):
+		logging.error("Invalid eXo file '%s'!", eXoFileName)
+		logging.info(_eXoLauncherHelp)
 		sys.exit(1)
+	
+	# Known eXo file, only the daemon has the cache in memory
+	fileStat 	= os.stat(eXoFileName)
+	cached 		= getCachedeXoInfos(eXoFileName, fileStat) if isDaemon else None
+	if cached is not None:
+		gamename, archive = cached
+		eXoFile = LazyeXoFile(eXoFileName)
+	else:
+		try:
+			eXoFile, gamename, archive = readeXoInfos(eXoFileName)
+		except ValueError as exception:
+			logging.error(str(exception))
+			sys.exit(1)
+		if isDaemon:
+			addeXoCacheEntry(eXoFileName, [fileStat.st_size, fileStat.st_mtime, gamename, archive])
 
 	logging.debug("> GameName : " + gamename)
 	logging.debug("> Archive  : " + archive)
 	return eXoFile, gamename, archive
 
+def scaneXoFile(eXoFileName):
+	# Runs in the scan workers, returns the cache entry or None if the eXo file is invalid
+	fileStat 	= os.stat(eXoFileName)
+	cached 		= getCachedeXoInfos(eXoFileName, fileStat)
+	if cached is not None:
+		return (eXoFileName, [fileStat.st_size, fileStat.st_mtime] + list(cached), True)
+	try:
+		eXoFile, gamename, archive = readeXoInfos(eXoFileName)
+		eXoFile.close()
+	except ValueError as exception:
+		logging.warning("> %s", exception)
+		return (eXoFileName, None, False)
+	return (eXoFileName, [fileStat.st_size, fileStat.st_mtime, gamename, archive], False)
+
+def eXoScan(dir):
+	logging.info("Scanning eXo files in '%s'...", dir)
+	dir = os.path.abspath(dir)
+	eXoFileNames = []
+	for root, dirs, files in os.walk(dir):
+		for file in files:
+			if file.lower().endswith(".exo"):
+				eXoFileNames.append(os.path.join(root, file))
+	
+	# Reading the new & modified eXo files
+	entries 	= dict()
+	cachedCount	= 0
+	for eXoFileName, entry, isCached in eXoMapGames(scaneXoFile, eXoFileNames):
+		if entry is not None:
+			entries[eXoFileName] = entry
+		if isCached:
+			cachedCount = cachedCount + 1
+	
+	# Forgetting the eXo files gone from this directory
+	cachedFiles 	= (jsonRead(exocachefile) or dict()).keys()
+	removedFiles 	= [eXoFileName for eXoFileName in cachedFiles if eXoFileName.startswith(dir + os.path.sep) and not os.path.isfile(eXoFileName)]
+	updateeXoCache(entries, removedFiles)
+	logging.info("> %i eXo files, %i already cached, %i invalid, %i removed", len(eXoFileNames), cachedCount, len(eXoFileNames) - len(entries), len(removedFiles))
+
 def getArchivePath(archive):
 	# Verify archive
-	archivepath = searchFileInDirectories(eXoCollections, archive)
+	archivepath = findArchive(archive)
 	if archivepath is None:
 		logging.error("No archive '%s' found in any collection!", archive)
 		sys.exit(1)
@@ -424,55 +2134,86 @@ def getArchivePath(archive):
 	
 def eXoInstall(eXoFileName):
 	logging.info("Installing eXo file '%s'...", eXoFileName)
+	request.timings.start("infos")
 	eXoFile, eXoGameName, archive = geteXoInfos(eXoFileName)
+	request.timings.start("archive")
 	eXoArchivePath = getArchivePath(archive)
+	request.timings.start("registry")
+	checkTrash(eXoGameName)
 	
-	# Gathering installed games
-	logging.info("> Looking for a manual installation of game '%s'...", eXoGameName)
-	installedGames 	= getInstalledGames()
-	if eXoGameName in installedGames.keys():
-		id = installedGames[eXoGameName]
-		logging.info("> Game '%s' is already installed in Install[%i]", eXoGameName, id)
-		return
-
-	# Find a free install slot
-	logging.info("> Game '%s' is not installed. installation in a free install slot...", eXoGameName)
-	id = findFreeInstall(installedGames)
-	if id is None:
-		logging.info("> No empty install slot, remove some installed games!")
-		return
+	lockGames()
+	try:
+		cleanPendingGames()
+		
+		# Looking for a manual installation
+		logging.info("> Looking for a manual installation of game '%s'...", eXoGameName)
+		dir = findRegisteredGame(eXoGameName, _InstallKind)
+		if dir is not None:
+			id = registry["dirs"][dir]["id"]
+			logging.info("> Game '%s' is already installed in Install[%i]", eXoGameName, id)
+			return
+	
+		# Find a free install slot
+		logging.info("> Game '%s' is not installed. installation in a free install slot...", eXoGameName)
+		checkTrash(eXoGameName)
+		id = findFreeInstall(getInstalledGames())
+		if id is None:
+			logging.info("> No empty install slot, remove some installed games!")
+			return
+		
+		logging.info("> Game '%s' will be installed in Install[%i]", eXoGameName, id)
+		installName = getInstallName(id)
+		installDir 	= os.path.join(gamesdir, installName)
+		reserveGameDir(installDir, eXoGameName, getGameSize(eXoGameName, eXoArchivePath))
+	finally:
+		unlockGames()
 
 	# Install game
-	logging.info("> Game '%s' will be installed in Install[%i]", eXoGameName, id)
-	installDir = os.path.join(gamesdir, getInstallName(id))
-	os.makedirs(installDir)
-	installGame(eXoFile, eXoGameName, eXoArchivePath, installDir)
+	try:
+		installGame(eXoFile, eXoGameName, eXoArchivePath, installDir)
+	finally:
+		unlockSlot(installName)
 	return installDir
 	
 def eXoRemove(eXoFileName):
 	logging.info("Removing eXo file '%s'...", eXoFileName)
+	request.timings.start("infos")
 	eXoFile, eXoGameName, archive = geteXoInfos(eXoFileName)
+	request.timings.start("registry")
 	
-	# Gathering installed games
-	logging.info("> Looking for a manual installation of game '%s'...", eXoGameName)
-	installedGames 	= getInstalledGames()
-	if eXoGameName not in installedGames.keys():
-		logging.error("> Game '%s' is not installed!", eXoGameName)
-		return
-
-	# Remove game
-	id 			= installedGames[eXoGameName]
-	installName = getInstallName(id)
-	installPath = os.path.join(gamesdir, installName)
-	logging.info("> Removing Install[%i] - %s...", id, installName)
-	removeGame(installPath)
-	rmTree(installPath)
+	lockGames()
+	try:
+		# Looking for a manual installation
+		logging.info("> Looking for a manual installation of game '%s'...", eXoGameName)
+		dir = findRegisteredGame(eXoGameName, _InstallKind)
+		if dir is None:
+			logging.error("> Game '%s' is not installed!", eXoGameName)
+			return
+		if not lockSlot(dir, False):
+			logging.error("> Game '%s' is in use!", eXoGameName)
+			return
+	
+		# Remove game
+		id 			= registry["dirs"][dir]["id"]
+		installName = getInstallName(id)
+		installPath = os.path.join(gamesdir, installName)
+		logging.info("> Removing Install[%i] - %s...", id, installName)
+		request.timings.start("removal")
+		try:
+			removeGame(installPath)
+		finally:
+			unlockSlot(dir)
+	finally:
+		unlockGames()
 
 
 def eXoLaunch(eXoFileName):
 	logging.info("Launching eXo file '%s'...", eXoFileName)
+	request.timings.start("infos")
 	eXoFile, gamename, archive = geteXoInfos(eXoFileName)
+	request.timings.start("archive")
 	archivepath = getArchivePath(archive)
+	addToHistory(eXoFileName)
 
 	#*****************************************************************
 	# Pre-processing
@@ -480,7 +2221,12 @@ def eXoLaunch(eXoFileName):
 
 	# Setting up directories
 	gameDir 	= getGame(eXoFile, gamename, archivepath)
-	gameDBConf 	= os.path.join(gameDir, _DBConf)
+	request.timings.start("config")
+	try:
+		launchConf = getLaunchConf(gameDir, gamename)
+	except:
+		unlockSlot(os.path.basename(gameDir))
+		raise
 
 	#*****************************************************************
 	# Execution
@@ -488,89 +2234,509 @@ def eXoLaunch(eXoFileName):
 
 	# Launching dosbox
 	logging.info("Launching DOSBox...")
-	process = subprocess.Popen([dbExePath, r'-noconsole', r'-exit', r'-conf', dbbaseconf, r'-conf', gameDBConf], cwd=dbDir)
-	process.wait()
-	logging.info("DOSBox exited(" + str(process.returncode) + ")")
+	request.timings.start("dosbox")
+	process = subprocess.Popen([dbExePath, r'-noconsole', r'-exit', r'-conf', launchConf], cwd=dbDir)
+	if isDaemon:
+		warmupGames(eXoFileName)
+	try:
+		process.wait()
+		logging.info("DOSBox exited(" + str(process.returncode) + ")")
+		request.timings.start("update")
+		updateGameSize(gameDir)
+	finally:
+		unlockSlot(os.path.basename(gameDir))
+
+def warmupGames(eXoFileName):
+	# Prefetching the games most likely to be launched next while this one runs
+	archiveCount = archiveCacheWarmup if archiveCacheDir else 0
+	eXoFileNames = [recent for recent in getRecentGames(max(daemonWarmup, archiveCount) + 1) if recent != os.path.abspath(eXoFileName)]
+	if eXoFileNames and (daemonWarmup or archiveCount):
+		thread = threading.Thread(target=warmup, args=(eXoFileNames, archiveCount))
+		thread.daemon = True
+		thread.start()
+
+def warmup(eXoFileNames, archiveCount):
+	# Installing the next games, then caching the archives of the ones after
+	if daemonWarmup:
+		eXoPrefetch(eXoFileNames[-daemonWarmup:])
+	if archiveCount:
+		eXoWarmArchives(eXoFileNames[-archiveCount:])
+
+def addToHistory(eXoFileName):
+	with open(historyfile, "ab") as history:
+		history.write("%r;%s\n" % (time.time(), os.path.abspath(eXoFileName)))
+
+def getRecentGames(count):
+	# The last launched eXo files, from the oldest to the most recent
+	recents = []
+	if os.path.isfile(historyfile):
+		with open(historyfile, "rb") as history:
+			for line in history:
+				eXoFileName = line.rstrip("\r\n").split(';', 1)[1]
+				if eXoFileName in recents:
+					recents.remove(eXoFileName)
+				recents.append(eXoFileName)
+	return recents[-count:]
+
+def readListFile(listFile):
+	# One eXo file per line, '-' for stdin
+	if listFile == "-":
+		lines = sys.stdin.readlines()
+	else:
+		with open(listFile, "r") as fo:
+			lines = fo.readlines()
+	return [line.strip() for line in lines if line.strip() and not line.startswith("#")]
+
+def eXoPrefetch(eXoFileNames):
+	logging.info("Prefetching %i eXo files...", len(eXoFileNames))
+	lowerPriority()
+	
+	# Prefetched games can't evict each other
+	prefetchedDirs = set()
+	for eXoFileName in eXoFileNames:
+		logging.info("Prefetching eXo file '%s'...", eXoFileName)
+		try:
+			eXoFile, gamename, archive = geteXoInfos(eXoFileName)
+			archivepath = getArchivePath(archive)
+		except SystemExit:
+			logging.warning("> Invalid eXo file '%s' -> Skipping", eXoFileName)
+			continue
+		gameDir = getGame(eXoFile, gamename, archivepath, prefetchedDirs)
+		if gameDir is None:
+			logging.info("> No more room, stopping prefetch")
+			break
+		unlockSlot(os.path.basename(gameDir))
+		prefetchedDirs.add(os.path.basename(gameDir))
+
+def resolveeXoFiles(eXoFileNames, results, withArchives = True):
+	# Reads every eXo file once, invalid ones get their result right away
+	games = []
+	for eXoFileName in eXoFileNames:
+		try:
+			eXoFile, gamename, archive = geteXoInfos(eXoFileName)
+			archivepath = getArchivePath(archive) if withArchives else None
+		except SystemExit:
+			logging.warning("> Invalid eXo file '%s' -> Skipping", eXoFileName)
+			results[eXoFileName] = "invalid eXo file or missing archive"
+			continue
+		games.append((eXoFileName, eXoFile, gamename, archivepath))
+	return games
+
+def reportResults(eXoFileNames, results):
+	logging.info("Summary :")
+	for eXoFileName in eXoFileNames:
+		logging.info("> %s : %s", eXoFileName, results[eXoFileName])
+
+def installListedGame(install):
+	# Runs in the batch workers, the install directory was reserved up front
+	eXoFileName, eXoFile, eXoGameName, eXoArchivePath, installDir = install
+	try:
+		installGame(eXoFile, eXoGameName, eXoArchivePath, installDir)
+		return (eXoFileName, "installed in Install[%i]" % int(installsMatcher.match(os.path.basename(installDir)).group(1)))
+	except Exception as exception:
+		logging.error("> Installing game '%s' failed : %s", eXoGameName, exception)
+		logging.debug(traceback.format_exc())
+		if os.path.isdir(getPartialDir(installDir)):
+			rmTree(getPartialDir(installDir))
+		unregisterGame(installDir)
+		return (eXoFileName, "failed (%s)" % exception)
+	finally:
+		unlockSlot(os.path.basename(installDir))
+
+def eXoInstallList(eXoFileNames):
+	logging.info("Installing %i eXo files...", len(eXoFileNames))
+	results = dict()
+	request.timings.start("infos")
+	games = resolveeXoFiles(eXoFileNames, results)
+	request.timings.start("registry")
+	for eXoFileName, eXoFile, eXoGameName, eXoArchivePath in games:
+		checkTrash(eXoGameName)
+	
+	# Reserving every install directory at once
+	installs = []
+	lockGames()
+	try:
+		cleanPendingGames()
+		installedGames 	= getInstalledGames()
+		freeSpace 		= getFreeSpace(gamesdir)
+		for eXoFileName, eXoFile, eXoGameName, eXoArchivePath in games:
+			dir = findRegisteredGame(eXoGameName, _InstallKind)
+			if dir is not None:
+				results[eXoFileName] = "already installed in Install[%i]" % registry["dirs"][dir]["id"]
+				continue
+			id = findFreeInstall(installedGames)
+			if id is None:
+				results[eXoFileName] = "no free install slot"
+				continue
+			checkTrash(eXoGameName)
+			gameSize = getGameSize(eXoGameName, eXoArchivePath)
+			if freeSpace is not None and gameSize > freeSpace:
+				results[eXoFileName] = "not enough disk space (%s needed)" % formatSize(gameSize)
+				continue
+			
+			logging.info("> Game '%s' will be installed in Install[%i]", eXoGameName, id)
+			installDir = os.path.join(gamesdir, getInstallName(id))
+			reserveGameDir(installDir, eXoGameName, gameSize)
+			installedGames[getInstallName(id)] = id
+			if freeSpace is not None:
+				freeSpace = freeSpace - gameSize
+			installs.append((eXoFileName, eXoFile, eXoGameName, eXoArchivePath, installDir))
+	finally:
+		unlockGames()
+	
+	# Installing
+	request.timings.start("installation")
+	results.update(eXoMapGames(installListedGame, installs))
+	reportResults(eXoFileNames, results)
+
+def eXoRemoveList(eXoFileNames):
+	logging.info("Removing %i eXo files...", len(eXoFileNames))
+	results = dict()
+	request.timings.start("infos")
+	games = resolveeXoFiles(eXoFileNames, results, False)
+	
+	# Removals change the games directory, they're done under the games lock
+	request.timings.start("removal")
+	lockGames()
+	try:
+		for eXoFileName, eXoFile, eXoGameName, eXoArchivePath in games:
+			dir = findRegisteredGame(eXoGameName, _InstallKind)
+			if dir is None:
+				results[eXoFileName] = "not installed"
+				continue
+			if not lockSlot(dir, False):
+				results[eXoFileName] = "in use"
+				continue
+			id = registry["dirs"][dir]["id"]
+			logging.info("> Removing Install[%i] - %s...", id, dir)
+			try:
+				removeGame(os.path.join(gamesdir, dir))
+				results[eXoFileName] = "removed from Install[%i]" % id
+			finally:
+				unlockSlot(dir)
+	finally:
+		unlockGames()
+	reportResults(eXoFileNames, results)
+
+#*****************************************************************
+#*****************************************************************
+# Daemon Mode
+#*****************************************************************
+#*****************************************************************
+# The daemon keeps the configuration, the collections index and the registry
+# in memory. Its address is in eXoLauncher.daemon, requests are one JSON
+# line with the command line, answers are JSON lines : ["log", message]...
+# then ["status", exit status].
+class DaemonLogHandler(logging.Handler):
+	# Sends the messages of a request back to its client
+	def __init__(self, connection):
+		logging.Handler.__init__(self, logging.INFO)
+		self.connection = connection
+		self.thread 	= threading.current_thread().ident
+		self.setFormatter(logging.Formatter('%(message)s'))
+	
+	def emit(self, record):
+		if record.thread == self.thread:
+			try:
+				self.connection.sendall(json.dumps(["log", self.format(record)]) + "\n")
+			except socket.error:
+				pass
+
+def connectDaemon():
+	# Returns a connection and the daemon token, None if no daemon is running
+	infos = jsonRead(daemonfile)
+	if infos is None:
+		return None
+	try:
+		if infos["family"] == "unix":
+			connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+			connection.connect(infos["address"])
+		else:
+			connection = socket.create_connection(tuple(infos["address"]))
+	except socket.error:
+		return None
+	return (connection, infos["token"])
+
+def eXoDaemonClient(argv):
+	# Returns the exit status of the command run by the daemon, None if it must run here
+	try:
+		opts, args = getopt.getopt(argv, _ShortOptions, _LongOptions)
+	except getopt.GetoptError:
+		return None
+	
+	# Paths are relative to the client, stdin stays here
+	requestArgv = []
+	for opt, arg in opts:
+		if opt in ("-h", "--daemon", "--no-daemon") or arg == "-":
+			return None
+		if opt in _PathOptions:
+			arg = os.path.abspath(arg)
+		requestArgv.append(opt)
+		if arg:
+			requestArgv.append(arg)
+	
+	daemon = connectDaemon()
+	if daemon is None:
+		return None
+	connection, token = daemon
+	try:
+		connection.sendall(json.dumps({ "token" : token, "argv" : requestArgv }) + "\n")
+		for line in connection.makefile("rb"):
+			kind, data = json.loads(line)
+			if kind == "log":
+				print data.encode("utf-8")
+				sys.stdout.flush()
+			elif kind == "status":
+				return data
+	except socket.error:
+		pass
+	finally:
+		connection.close()
+	print "Connection to the daemon lost!"
+	return 1
+
+def eXoServe(connection, token):
+	handler = None
+	status 	= 0
+	try:
+		message = jsonEncodeStrings(json.loads(connection.makefile("rb").readline()))
+		if message.get("token") != token:
+			logging.warning("> Rejecting request with an invalid token")
+			return
+		logging.info("> Request : %s", " ".join(message["argv"]))
+		handler = DaemonLogHandler(connection)
+		logging.getLogger().addHandler(handler)
+		eXoRun(message["argv"])
+	except SystemExit as exception:
+		status = exception.code if isinstance(exception.code, int) else int(exception.code is not None)
+	except:
+		logging.error("Unexpected error!")
+		logging.debug(traceback.format_exc())
+		status = 1
+	finally:
+		if handler is not None:
+			logging.getLogger().removeHandler(handler)
+		try:
+			connection.sendall(json.dumps(["status", status]) + "\n")
+		except socket.error:
+			pass
+		connection.close()
+
+def stopDaemon(signum, frame):
+	raise KeyboardInterrupt
+
+def eXoDaemon():
+	global isDaemon
+	if connectDaemon() is not None:
+		logging.error("A daemon is already running!")
+		sys.exit(1)
+	
+	# Unix domain socket when available, local TCP otherwise (Windows)
+	logging.info("Starting daemon...")
+	if hasattr(socket, "AF_UNIX"):
+		if os.path.exists(socketfile):
+			os.remove(socketfile)
+		server 	= socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+		server.bind(socketfile)
+		infos 	= { "family" : "unix", "address" : socketfile }
+	else:
+		server 	= socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+		server.bind(("127.0.0.1", daemonPort))
+		infos 	= { "family" : "tcp", "address" : list(server.getsockname()) }
+	server.listen(5)
+	token = uuid.uuid4().hex
+	infos["token"] 	= token
+	infos["pid"] 	= os.getpid()
+	jsonWrite(daemonfile, infos)
+	if os.name != "nt":
+		os.chmod(daemonfile, 0600)
+	isDaemon = True
+	
+	# Stopped by Ctrl+C or kill
+	signal.signal(signal.SIGINT, stopDaemon)
+	signal.signal(signal.SIGTERM, stopDaemon)
+	
+	# Warming up
+	loadCollectionsIndex()
+	loadRegistry()
+	logging.info("> Listening on %s", infos["address"])
+	try:
+		while True:
+			connection, address = server.accept()
+			thread = threading.Thread(target=eXoServe, args=(connection, token))
+			thread.daemon = True
+			thread.start()
+	except KeyboardInterrupt:
+		logging.info("Stopping daemon...")
+	finally:
+		server.close()
+		os.remove(daemonfile)
+		if infos["family"] == "unix":
+			os.remove(socketfile)
 
 #*****************************************************************
 #*****************************************************************
 # Convert Mode
 #*****************************************************************
 #*****************************************************************
-def eXoCopyFile(eXoGameName, eXoFilePath, outputDir):
-	if eXoFilePath and outputDir:
-		if os.path.isfile(eXoFilePath):
-			logging.debug("Import file '" + eXoFilePath + "' into '" + outputDir + "...")
-			filename, fileext 	= os.path.splitext(eXoFilePath)
-			dstname				= eXoGameName + fileext
-			dst					= os.path.join(outputDir, dstname)
-			shutil.copyfile(eXoFilePath, dst)
-			return(dst)
+def getOutputName(eXoGameName, kind):
+	return eXoGameName
+
+def getLBOutputName(eXoGameName, kind):
+	# LaunchBox finds the images by title, titles & screenshots share a directory
+	return nameCleaner.sub('', eXoGameName).strip() + _LBArtworkSuffixes.get(kind, "")
 
-def eXoMoveFile(eXoGameName, eXoFilePath, outputDir):
+def reflinkFile(source, destination):
+	# Copy-on-write clone (Btrfs, XFS), only on Linux
+	if not sys.platform.startswith("linux"):
+		return False
+	try:
+		with open(source, "rb") as fi, open(destination, "wb") as fo:
+			fcntl.ioctl(fo.fileno(), _FICLONE, fi.fileno())
+		return True
+	except (IOError, OSError):
+		if os.path.isfile(destination):
+			os.remove(destination)
+		return False
+
+def linkArtwork(source, destination):
+	# Hardlink, clone or copy as a last resort, returns the written bytes
+	try:
+		linkFile(source, destination)
+		return 0
+	except OSError:
+		pass
+	if reflinkFile(source, destination):
+		bytesWritten = 0
+	else:
+		shutil.copyfile(source, destination)
+		bytesWritten = os.path.getsize(destination)
+	fileStat = os.stat(source)
+	os.utime(destination, (fileStat.st_atime, fileStat.st_mtime))
+	return bytesWritten
+
+def loadPIL():
+	# Imported by the import modes only, False when PIL is not installed
+	global Image
+	if Image is None:
+		try:
+			from PIL import Image
+		except ImportError:
+			Image = False
+	return Image
+
+def isArtworkConverted(kind, fileext):
+	# Manuals are never degraded
+	if not Image or kind == _ManualsDir:
+		return False
+	return bool(artworkMaxSize or artworkFormat) and fileext.lower() in _ArtworkExtensions
+
+def convertArtwork(source, destination):
+	# Downscaled and/or recompressed image, None when the image is kept as is
+	image = Image.open(source)
+	image.load()
+	format 		= _ArtworkFormats[artworkFormat] if artworkFormat else image.format
+	isLarger 	= artworkMaxSize is not None and (image.size[0] > artworkMaxSize[0] or image.size[1] > artworkMaxSize[1])
+	if not isLarger and format == image.format:
+		return None
+	if isLarger:
+		image.thumbnail(artworkMaxSize, Image.ANTIALIAS)
+	if format == "JPEG" and image.mode not in ["RGB", "L"]:
+		image = image.convert("RGB")
+	tempFile = destination + ".tmp"
+	image.save(tempFile, format, quality=artworkQuality, optimize=True)
+	os.rename(tempFile, destination)
+	fileStat = os.stat(source)
+	os.utime(destination, (fileStat.st_atime, fileStat.st_mtime))
+	return os.path.getsize(destination)
+
+def eXoImportArtwork(eXoGameName, eXoFilePath, outputDir, kind):
 	if eXoFilePath and outputDir:
 		if os.path.isfile(eXoFilePath):
-			logging.debug("Import file '" + eXoFilePath + "' into '" + outputDir + "...")
 			filename, fileext 	= os.path.splitext(eXoFilePath)
-			dstname				= eXoGameName + fileext
-			dst					= os.path.join(outputDir, dstname)
-			shutil.move(eXoFilePath, dst)
+			isConverted			= isArtworkConverted(kind, fileext)
+			if isConverted and artworkFormat:
+				fileext = "." + artworkFormat
+			dst					= os.path.join(outputDir, request.outputNamer(eXoGameName, kind) + fileext)
+			srcStat 			= os.stat(eXoFilePath)
+			
+			# Outputs are kept when they have the source mtime (and size when not converted)
+			if os.path.isfile(dst):
+				dstStat = os.stat(dst)
+				if abs(dstStat.st_mtime - srcStat.st_mtime) < 1 and (isConverted or dstStat.st_size == srcStat.st_size):
+					logging.debug("File '%s' is up to date", dst)
+					return(dst)
+				os.remove(dst)
+			
+			logging.debug("Import file '" + eXoFilePath + "' into '" + outputDir + "...")
+			bytesWritten = None
+			if isConverted:
+				try:
+					bytesWritten = convertArtwork(eXoFilePath, dst)
+				except IOError:
+					logging.warning("> Unable to read image '%s' -> Keeping it", eXoFilePath)
+					dst = os.path.join(outputDir, request.outputNamer(eXoGameName, kind) + os.path.splitext(eXoFilePath)[1])
+					if os.path.isfile(dst):
+						os.remove(dst)
+			if bytesWritten is None:
+				bytesWritten = linkArtwork(eXoFilePath, dst)
+			request.timings.add(bytesRead=srcStat.st_size if bytesWritten else 0, bytesWritten=bytesWritten, files=1)
 			return(dst)
 
-def eXoCreateIniFile(eXoGameInfos, iniOutPath):
-	logging.debug("Creating ini file '" + iniOutPath + "'")
+def eXoCreateIniFile(eXoGameInfos):
+	# Returns the game.ini content
+	logging.debug("Creating ini file...")
 	configparser = ConfigParser.ConfigParser()
 	configparser.optionxform=str # For case sensitiveness
 	configparser.add_section(_eXoLoaderSection)
 	configparser.set(_eXoLoaderSection, _GameNameKey, eXoGameInfos.gamename)
 	configparser.set(_eXoLoaderSection, _ArchiveKey, eXoGameInfos.archivename)
-	with open(iniOutPath, 'w') as configfile: configparser.write(configfile)
+	configfile = cStringIO.StringIO()
+	configparser.write(configfile)
+	return configfile.getvalue()
 
-def eXoConvertDosBOXConf(dbConfInPath, dbConfOutPath):
-	# Converting/Modifying the configuration
-	logging.debug("Converting DosBOX configuration '" + dbConfInPath + "' into '" + dbConfOutPath + "'")
+def eXoConvertDosBOXConf(dbConfInPath):
+	# Returns the converted/modified configuration
+	logging.debug("Converting DosBOX configuration '" + dbConfInPath + "'")
 	currentKey	= ""
-	confin 		= open(dbConfInPath, "rb")
-	confout		= open(dbConfOutPath, "wb")
-	for line in confin:
-		#if line is a key
-		if "[" in line:
-			# Memorize it
-			currentKey = line.strip()
-		
-		# Don't import dosbox base items (They are in the base eXoLauncher dosbox.conf)
-		if currentKey not in ["[sdl]", "[render]", "[mixer]", "[midi]"]:
-			newline = line
-			# Replace eXo dependent stuffs
-			newline = newline.replace(r".\games", r"__DB_ROOT_DIR__")
-			confout.write(newline)
-	confout.close()
-	confin.close()
+	lines		= []
+	with open(dbConfInPath, "rb") as confin:
+		for line in confin:
+			#if line is a key
+			if "[" in line:
+				# Memorize it
+				currentKey = line.strip()
+			
+			# Don't import dosbox base items (They are in the base eXoLauncher dosbox.conf)
+			if currentKey not in ["[sdl]", "[render]", "[mixer]", "[midi]"]:
+				# Replace eXo dependent stuffs
+				lines.append(line.replace(r".\games", r"__DB_ROOT_DIR__"))
+	return "".join(lines)
 
 def eXoCreateFile(eXoGameInfos, dir):
 	logging.debug("Creating eXoFile...")
 	
 	# init
 	eXoFile = os.path.join(dir, eXoGameInfos.gamename + ".exo")
-
-	# Create eXo file
-	tempDir = mkTempDir()
 	
-	# Ini file
-	eXoCreateIniFile(eXoGameInfos, os.path.join(tempDir, _GameIni))
-	
-	# dosbox.conf
-	eXoConvertDosBOXConf(eXoGameInfos.dbconf, os.path.join(tempDir, _DBConf))
-	
-	# mapper.map
+	# Ini file, dosbox.conf & mapper.map
+	members = [(_GameIni, eXoCreateIniFile(eXoGameInfos)), (_DBConf, eXoConvertDosBOXConf(eXoGameInfos.dbconf))]
 	if eXoGameInfos.dbmapper : 
-		shutil.copyfile(eXoGameInfos.dbmapper, os.path.join(tempDir, _DBMapperMap))
+		with open(eXoGameInfos.dbmapper, "rb") as mapper:
+			members.append((_DBMapperMap, mapper.read()))
 	
-	# Compression
-	zipf = zipfile.ZipFile(eXoFile, 'w')
-	zipdir(tempDir, zipf)
+	# Assembled in memory, the eXo file is written at once
+	zipBuffer 	= cStringIO.StringIO()
+	zipf 		= zipfile.ZipFile(zipBuffer, 'w')
+	for name, data in members:
+		logging.debug("Archiving file : " + name)
+		info = zipfile.ZipInfo(name, time.localtime()[:6])
+		info.external_attr = 0644 << 16
+		zipf.writestr(info, data)
 	zipf.close()
-	rmTempDir(tempDir)
+	with open(eXoFile, "wb") as fo:
+		fo.write(zipBuffer.getvalue())
+	request.timings.add(bytesRead=sum(len(data) for name, data in members), bytesWritten=len(zipBuffer.getvalue()), files=len(members))
 	
 	return(eXoFile)
 
@@ -590,7 +2756,11 @@ def eXoGetIniOption(configParser, section, option):
 	except:
 		return
 
-class GameInfos:
+class GameInfos(object):
+	# One per game being imported, only the needed fields are kept
+	__slots__ = ["gamename", "gamedir", "archivename", "dbconf", "dbmapper", "name", "publisher", "developer", "year", "serie",
+	"about", "info", "front", "back", "title", "screen", "manual", "exofile", "genre"]
+	
 	def __init__(self,
 	eXoGameName,
 	eXoGameDir,
@@ -600,6 +2770,7 @@ class GameInfos:
 	eXoIniFile):
 		# Init
 		self.gamename 		= eXoGameName
+		self.gamedir		= eXoGameDir
 		self.archivename 	= eXoArchiveName
 		self.dbconf			= eXoDBConf
 		self.dbmapper		= eXoDBMapper
@@ -613,7 +2784,8 @@ class GameInfos:
 		self.developer		= eXoGetIniOption(configparser, "Main", "Developer")
 		self.year			= int(''.join(c for c in eXoGetIniOption(configparser, "Main", "Year") if c in string.digits).ljust(4,'0'))
 		self.serie			= eXoGetIniOption(configparser, "Main", "Series")
-		self.info			= asciiCorrector.sub(' ', eXoGetDesc(eXoGetRealFilePath(os.path.join(eXoGameDir, _Meagre, "About"), eXoGetIniOption(configparser, "Main", "About"))))
+		self.about			= eXoGetRealFilePath(os.path.join(eXoGameDir, _Meagre, "About"), 	eXoGetIniOption(configparser, "Main", "About"))
+		self.info			= asciiCorrector.sub(' ', eXoGetDesc(self.about))
 		self.front 			= eXoGetRealFilePath(os.path.join(eXoGameDir, _Meagre, "Front"), 	eXoGetIniOption(configparser, "Main", "Front01"))
 		self.back 			= eXoGetRealFilePath(os.path.join(eXoGameDir, _Meagre, "Back"), 	eXoGetIniOption(configparser, "Main", "Back01"))
 		self.title 			= eXoGetRealFilePath(os.path.join(eXoGameDir, _Meagre, "Title"), 	eXoGetIniOption(configparser, "Main", "Title01"))
@@ -643,17 +2815,67 @@ class GameInfos:
 		self.screen 		= screen
 		self.manual 		= manual
 
+	def getOutputs(self):
+		return [output for output in [self.exofile, self.front, self.back, self.title, self.screen, self.manual] if output]
+
+def eXoGetFingerprint(eXoGameInfos, eXoFiles, outputDirs):
+	# Size & mtime of every source file of a game, and the requested outputs
+	fingerprint = [sorted(key for key, value in outputDirs.items() if value)]
+	eXoFiles = eXoFiles + [eXoGameInfos.dbconf, eXoGameInfos.dbmapper, eXoGameInfos.about,
+	eXoGameInfos.front, eXoGameInfos.back, eXoGameInfos.title, eXoGameInfos.screen, eXoGameInfos.manual]
+	for eXoFile in eXoFiles:
+		if eXoFile and os.path.isfile(eXoFile):
+			fileStat = os.stat(eXoFile)
+			fingerprint.append([os.path.relpath(eXoFile, eXoGameInfos.gamedir), fileStat.st_size, fileStat.st_mtime])
+	return fingerprint
+
+class ImportManifest:
+	# Fingerprints and outputs of the imported games, by game directory name
+	def __init__(self, path):
+		self.path 	= path
+		self.games 	= (jsonRead(path) or dict()).get("games", dict())
+		self.seen	= set()
+		self.lock	= threading.Lock()
+	
+	def isUnchanged(self, eXoGameDir, fingerprint):
+		with self.lock:
+			entry = self.games.get(os.path.basename(eXoGameDir))
+		if entry is None or entry["fingerprint"] != fingerprint:
+			return False
+		# Outputs may have been deleted
+		return all(os.path.isfile(output) for output in entry["outputs"])
+	
+	def update(self, eXoGameDir, fingerprint, outputs):
+		with self.lock:
+			self.games[os.path.basename(eXoGameDir)] = { "fingerprint" : fingerprint, "outputs" : outputs }
+	
+	def prune(self):
+		# Removing the outputs of games not in the collection anymore, returns them
+		prunedOutputs = []
+		for key in sorted(set(self.games.keys()) - self.seen):
+			logging.info("> Game '%s' was removed from the collection -> Pruning", key)
+			for output in self.games[key]["outputs"]:
+				if os.path.isfile(output):
+					logging.debug("Removing file '%s'", output)
+					os.remove(output)
+				prunedOutputs.append(output)
+			del self.games[key]
+		return prunedOutputs
+	
+	def save(self):
+		jsonWrite(self.path, { "games" : self.games })
+
 def eXoImportGame(eXoGameInfos, outputDirs):
 	logging.info("Importing game '" + eXoGameInfos.gamename + "'...")
 	
 	# Create eXoFile
 	eXoGameInfos.update(
 	eXoCreateFile(eXoGameInfos, outputDirs[_GamesDir]),
-	eXoCopyFile(eXoGameInfos.gamename, eXoGameInfos.front, outputDirs[_FrontsDir]),
-	eXoCopyFile(eXoGameInfos.gamename, eXoGameInfos.back, outputDirs[_BacksDir]),
-	eXoCopyFile(eXoGameInfos.gamename, eXoGameInfos.title, outputDirs[_TitlesDir]),
-	eXoCopyFile(eXoGameInfos.gamename, eXoGameInfos.screen, outputDirs[_ScreensDir]),
-	eXoCopyFile(eXoGameInfos.gamename, eXoGameInfos.manual, outputDirs[_ManualsDir]))
+	eXoImportArtwork(eXoGameInfos.gamename, eXoGameInfos.front, outputDirs[_FrontsDir], _FrontsDir),
+	eXoImportArtwork(eXoGameInfos.gamename, eXoGameInfos.back, outputDirs[_BacksDir], _BacksDir),
+	eXoImportArtwork(eXoGameInfos.gamename, eXoGameInfos.title, outputDirs[_TitlesDir], _TitlesDir),
+	eXoImportArtwork(eXoGameInfos.gamename, eXoGameInfos.screen, outputDirs[_ScreensDir], _ScreensDir),
+	eXoImportArtwork(eXoGameInfos.gamename, eXoGameInfos.manual, outputDirs[_ManualsDir], _ManualsDir))
 	return(eXoGameInfos)
 
 def findIniFile(dir):
@@ -695,7 +2917,7 @@ def eXoConvertGameDir(eXoGameDir, outputDirs):
 	if eXoArchiveName == os.path.splitext(eXoArchiveName)[0]:
 		logging.warning("> Archive '%r' has no extension -> Adding '.zip'", eXoArchiveName)
 		eXoArchiveName = eXoArchiveName + ".zip"
-	if not searchFileInDirectories(eXoCollections, eXoArchiveName):
+	if not findArchive(eXoArchiveName):
 		logging.warning("> No archive '%r' found in any collection! -> Skipping", eXoArchiveName)
 		return
 	
@@ -714,13 +2936,24 @@ def eXoConvertGameDir(eXoGameDir, outputDirs):
 		
 	# Import
 	eXoGameName = os.path.splitext(eXoArchiveName)[0]
-	return(eXoImportGame(GameInfos(
+	eXoGameInfos = GameInfos(
 	eXoGameName,
 	eXoGameDir,
 	eXoArchiveName,
 	eXoDBConf,
 	eXoDBMapper,
-	eXoIniFile), outputDirs))
+	eXoIniFile)
+	
+	# Incremental import
+	if request.importManifest is not None:
+		fingerprint = eXoGetFingerprint(eXoGameInfos, [eXoInstallBat, eXoIniFile], outputDirs)
+		if request.importManifest.isUnchanged(eXoGameDir, fingerprint):
+			logging.info("> Game '%s' is unchanged -> Skipping", eXoGameName)
+			return
+		eXoImportGame(eXoGameInfos, outputDirs)
+		request.importManifest.update(eXoGameDir, fingerprint, eXoGameInfos.getOutputs())
+		return(eXoGameInfos)
+	return(eXoImportGame(eXoGameInfos, outputDirs))
 
 def eXoConvertDir(dir, outputDirs):
 	# Verify
@@ -736,15 +2969,58 @@ def eXoConvertDir(dir, outputDirs):
 		return(1)
 	
 	# Process subirectories
-	eXoGamesInfos = []
+	eXoGameDirs = []
 	for item in os.listdir(eXoDir):
 		eXoGameDir = os.path.join(eXoDir,item)
 		if os.path.isdir(eXoGameDir):
-			eXoGame = eXoConvertGameDir(eXoGameDir, outputDirs)
-			if eXoGame is not None:
-				eXoGamesInfos.append(eXoGame)
+			eXoGameDirs.append(eXoGameDir)
+			if request.importManifest is not None:
+				request.importManifest.seen.add(item)
+	
+	# Games are yielded as soon as they are converted
+	return(eXoFilterGames(eXoIterGames(lambda eXoGameDir: eXoConvertGameDir(eXoGameDir, outputDirs), eXoGameDirs)))
+
+def eXoFilterGames(eXoGames):
+	for eXoGame in eXoGames:
+		if eXoGame is not None:
+			yield eXoGame
+
+def eXoIterGames(function, items):
+	# Games are I/O bound, workers keep the items order
+	if request.importJobs > 1:
+		logging.info("Processing with %i jobs...", request.importJobs)
+		pool = ThreadPool(request.importJobs)
+		try:
+			for result in pool.imap(requestThread(function), items, 1):
+				yield result
+		finally:
+			pool.close()
+			pool.join()
+	else:
+		for item in items:
+			yield function(item)
+
+def eXoMapGames(function, items):
+	return list(eXoIterGames(function, items))
+
+def eXoConvertArchiveGame(eXoGamesArcPath, item, infos, outputDirs, handles, archives):
+	# Each worker has its own handle on the collection archive
+	if not hasattr(handles, "archive"):
+		handles.archive = zipfile.ZipFile(eXoGamesArcPath)
+		archives.append(handles.archive)
 	
-	return(eXoGamesInfos)
+	# Extracting only this game
+	tempDir = mkTempDir()
+	try:
+		for info in infos:
+			path = handles.archive.extract(info, tempDir)
+			if not info.filename.endswith("/"):
+				# Keeps fingerprints stable between imports
+				mtime = time.mktime(info.date_time + (0, 0, -1))
+				os.utime(path, (mtime, mtime))
+		return eXoConvertGameDir(os.path.join(tempDir, _eXoDosKey, item), outputDirs)
+	finally:
+		rmTempDir(tempDir)
 
 def eXoConvertArchive(eXoGamesArcPath, outputDirs):
 	# If archive not exists
@@ -766,22 +3042,31 @@ def eXoConvertArchive(eXoGamesArcPath, outputDirs):
 		logging.error("File '" + eXoGamesArcPath + "' is not a valid zip archive!")
 		return(1)
 
-	# Creating temp dir
-	logging.info("Creating temporary directory...")
-	tempDir = mkTempDir()
-
-	# Convert
-	logging.info("Extracting archive file '" + eXoGamesArcPath + "'...")
-	archive.extractall(tempDir)
-	
-	# Convert directory
-	eXoGamesInfos = eXoConvertDir(tempDir, outputDirs)
+	# Grouping members by game directory
+	prefix 		= _eXoDosKey + "/"
+	eXoGames 	= collections.OrderedDict()
+	for info in archive.infolist():
+		if info.filename.startswith(prefix):
+			parts = info.filename[len(prefix):].split("/", 1)
+			if len(parts) == 2 and parts[0]:
+				eXoGames.setdefault(parts[0], []).append(info)
+	archive.close()
+	if request.importManifest is not None:
+		request.importManifest.seen.update(eXoGames.keys())
 	
-	# Removing temp directory
-	logging.info("Removing temporary directory...")
-	rmTempDir(tempDir)
-	
-	return(eXoGamesInfos)
+	# Convert games one by one, only the games being converted are on disk
+	logging.info("Converting %i games from archive file '%s'...", len(eXoGames), eXoGamesArcPath)
+	return(eXoFilterGames(eXoIterArchiveGames(eXoGamesArcPath, eXoGames, outputDirs)))
+
+def eXoIterArchiveGames(eXoGamesArcPath, eXoGames, outputDirs):
+	handles 	= threading.local()
+	archives 	= []
+	try:
+		for eXoGame in eXoIterGames(lambda item: eXoConvertArchiveGame(eXoGamesArcPath, item, eXoGames[item], outputDirs, handles, archives), eXoGames.keys()):
+			yield eXoGame
+	finally:
+		for archive in archives:
+			archive.close()
 
 def eXoConvertCollection(collection, outputDirs, doImportArtworks, doImportManuals):
 	# According to parameter (file/directory)
@@ -795,7 +3080,7 @@ def eXoConvertCollection(collection, outputDirs, doImportArtworks, doImportManua
 		logging.error("File '" + collection + "' not found!")
 		return(1)
 
-def eXoImportCollection(collection, outputDir, doImportArtworks, doImportManuals):
+def eXoImportCollection(collection, outputDir, doImportArtworks, doImportManuals, doPrune = False, manifestDir = None, artworkDirs = None, artworkNamer = getOutputName):
 	# Game dir
 	outputDirs = dict()
 	outputDirs[_GamesDir] 	= os.path.join(outputDir, _GamesDir)
@@ -816,20 +3101,70 @@ def eXoImportCollection(collection, outputDir, doImportArtworks, doImportManuals
 	if doImportManuals:
 		outputDirs[_ManualsDir] = os.path.join(outputDir, _ManualsDir)
 	
+	# Resizing & recompressing artworks needs PIL
+	if doImportArtworks and (artworkMaxSize or artworkFormat) and not loadPIL():
+		logging.warning("PIL is not installed, artworks won't be resized nor recompressed!")
+	
+	# Artworks & manuals directly in their final directories
+	if artworkDirs:
+		for kind in artworkDirs:
+			if outputDirs[kind]:
+				outputDirs[kind] = artworkDirs[kind]
+	request.outputNamer = artworkNamer
+	
 	# Create output dirs
 	for dir in outputDirs.values():
 		if dir and not os.path.isdir(dir): 
 			os.makedirs(dir)
 
-	# Convert collection
-	return(eXoConvertCollection(collection, outputDirs, doImportArtworks, doImportManuals))
-
-def findElement(parent, elementName, key, value):
-	for element in parent.findall(elementName):
-		if element.find(key).text == value:
-			return element
+	# Only new or changed games are imported
+	request.timings.start("import")
+	loadCollectionsIndex()
+	request.importManifest = ImportManifest(os.path.join(manifestDir or outputDir, _ImportManifest))
 
-def eXoImportCollectionLB(collection, lbDir, doImportArtworks, doImportManuals):
+	# Convert collection, games are imported while they are consumed
+	eXoGames = eXoConvertCollection(collection, outputDirs, doImportArtworks, doImportManuals)
+	if eXoGames == 1:
+		return(1)
+	return(eXoImportGames(eXoGames, doPrune))
+
+def eXoImportGames(eXoGames, doPrune):
+	for eXoGameInfos in eXoGames:
+		yield eXoGameInfos
+	if doPrune:
+		request.importManifest.prune()
+	request.importManifest.save()
+
+def iterXmlChildren(xmlPath, rootAttribs = None):
+	# Yields the children of the root element one at a time, they're cleared afterwards
+	depth = 0
+	root = None
+	for event, element in ET.iterparse(xmlPath, events=("start", "end")):
+		if event == "start":
+			if depth == 0:
+				root = element
+				if rootAttribs is not None:
+					rootAttribs.update(element.attrib)
+					rootAttribs["__tag__"] = element.tag
+			depth = depth + 1
+		else:
+			depth = depth - 1
+			if depth == 1:
+				yield element
+				# Forgetting the processed elements
+				root.clear()
+
+def getXmlStartTag(rootAttribs):
+	attribs = "".join(" %s=%s" % (key, quoteattr(value)) for key, value in sorted(rootAttribs.items()) if key != "__tag__")
+	return "<%s%s>\n" % (rootAttribs["__tag__"], attribs)
+
+def writeXmlChild(fo, element):
+	# Same layout as xmlIndent on the whole document
+	xmlIndent(element, 1)
+	element.tail = None
+	fo.write("  " + ET.tostring(element, encoding="us-ascii") + "\n")
+
+def eXoImportCollectionLB(collection, lbDir, doImportArtworks, doImportManuals, doPrune = False):
 	logging.info("Exporting collections to LaunchBox...")
 	
 	lbXml 			= os.path.join(lbDir, "LaunchBox.xml")
@@ -855,19 +3190,6 @@ def eXoImportCollectionLB(collection, lbDir, doImportArtworks, doImportManuals):
 		logging.error("Directory '%r' not found!", lbManualsDir)
 		return(1)
 	
-	logging.info("Parsing 'LaunchBox.xml'...")
-	xmlDoc 	= ET.parse(lbXml)
-	lbElm 	= xmlDoc.getroot()
-	
-	# Caching games/platforms
-	logging.info("Caching all games...")
-	lbGames = dict()
-	for gameElement in lbElm.findall("Game"):
-		lbGameName 		= gameElement.find("Title").text
-		lbGamePlateform = gameElement.find("Platform").text
-		if lbGameName not in lbGames: lbGames[lbGameName] = dict()
-		lbGames[lbGameName][lbGamePlateform] = gameElement
-	
 	# Creating destination directories
 	lbeXoGamesDir 	= os.path.join(lbGamesDir, lbPlatform)
 	lbeXoImagesDir	= os.path.join(lbImagesDir, lbPlatform)
@@ -882,99 +3204,140 @@ def eXoImportCollectionLB(collection, lbDir, doImportArtworks, doImportManuals):
 	if not os.path.isdir(lbeXoBacksDir): os.makedirs(lbeXoBacksDir)
 	if not os.path.isdir(lbeXoScreensDir): os.makedirs(lbeXoScreensDir)
 	
-	# Creating temp dir
-	logging.info("Creating temporary directory...")
-	tempDir = mkTempDir()
+	# Games, artworks & manuals are imported in place
+	lbOutputDirs = {
+		_GamesDir 	: lbeXoGamesDir,
+		_FrontsDir 	: lbeXoFrontsDir,
+		_BacksDir 	: lbeXoBacksDir,
+		_TitlesDir 	: lbeXoScreensDir,
+		_ScreensDir : lbeXoScreensDir,
+		_ManualsDir : lbeXoManualsDir }
+	eXoGames = eXoImportCollection(collection, lbDir, doImportArtworks, doImportManuals, False, lbDir, lbOutputDirs, getLBOutputName)
+	if eXoGames == 1:
+		return(1)
 	
-	# Import in temporary directory
-	eXoGamesInfos = eXoImportCollection(collection, tempDir, doImportArtworks, doImportManuals)
-
-	# Emulator
-	isEmulatorCreated = False
-	emuId	= str(uuid.uuid1())
-	emuElm 	= findElement(lbElm, "Emulator", "Title", lbEmulator)
-	if emuElm is not None:
-		logging.info("Reading Emulator '%s' informations...", lbEmulator)
-		isEmulatorCreated = False
-		emuId = emuElm.find("ID").text
-	else:
-		logging.info("Creating Emulator '%s'...", lbEmulator)
-		isEmulatorCreated = True
-		emuElm = ET.SubElement(lbElm, "Emulator")
-		ET.SubElement(emuElm, "ID").text 								= emuId
-		ET.SubElement(emuElm, "Title").text 							= lbEmulator
-		ET.SubElement(emuElm, "ApplicationPath").text 					= scriptpath
-		ET.SubElement(emuElm, "CommandLine").text 						= "-r"
-		ET.SubElement(emuElm, "NoQuotes").text 							= "false"
-		ET.SubElement(emuElm, "NoSpace").text 							= "false"
-		ET.SubElement(emuElm, "HideConsole").text 						= "false"
-		ET.SubElement(emuElm, "FileNameWithoutExtensionAndPath").text 	= "false"
-		ET.SubElement(emuElm, "DefaultPlatform")
-	
-	# Platform
-	isPlatformCreated = False
-	platformElm = findElement(lbElm, "Platform", "Name", lbPlatform)
-	if platformElm is None:
-		logging.info("Creating Platform '%s'...", lbPlatform)
-		isPlatformCreated = True
-		platformElm = ET.SubElement(lbElm, "Platform")
-		ET.SubElement(platformElm, "Name").text = str(lbPlatform)
-	
-	# EmulatorPlatform
-	if isEmulatorCreated or isPlatformCreated:
-		logging.info("Creating EmulatorPlatform...")
-		platformElm = ET.SubElement(lbElm, "EmulatorPlatform")
-		ET.SubElement(platformElm, "Emulator").text = emuId
-		ET.SubElement(platformElm, "Platform").text = lbPlatform
-		ET.SubElement(platformElm, "Default").text = "false"
-		ET.SubElement(platformElm, "CommandLine")
-
-	for gameInfos in eXoGamesInfos:
-		lbeXoGame = nameCleaner.sub('', gameInfos.gamename).strip()
-		logging.info("Searching game '%s'...", lbeXoGame)
-		if lbeXoGame in lbGames:
-			if lbPlatform in lbGames[lbeXoGame]:
-				logging.info("> Game '%s' found for Platform '%s'! Removing...", lbeXoGame, lbPlatform)
-				lbElm.remove(lbGames[lbeXoGame][lbPlatform])
-				del lbGames[lbeXoGame][lbPlatform]
-		logging.info("Importing game '%s'...", lbeXoGame)
-		gameElm = ET.SubElement(lbElm, "Game")
-		ET.SubElement(gameElm, "ID").text 				= str(uuid.uuid1())
-		ET.SubElement(gameElm, "Title").text 			= lbeXoGame
-		ET.SubElement(gameElm, "ApplicationPath").text 	= eXoMoveFile(gameInfos.gamename, gameInfos.exofile, lbeXoGamesDir)
-		ET.SubElement(gameElm, "Developer").text 		= gameInfos.developer
-		ET.SubElement(gameElm, "Publisher").text 		= gameInfos.publisher
-		ET.SubElement(gameElm, "ReleaseDate").text 		= datetime.datetime(int(gameInfos.year), 1, 1, 0, 0).isoformat()
-		ET.SubElement(gameElm, "Genre").text 			= gameInfos.genre
-		ET.SubElement(gameElm, "Series").text 			= gameInfos.serie
-		ET.SubElement(gameElm, "Notes").text 			= gameInfos.info
-		ET.SubElement(gameElm, "DateAdded").text 		= datetime.datetime.now().isoformat()
-		ET.SubElement(gameElm, "DateModified").text 	= datetime.datetime.now().isoformat()
-		ET.SubElement(gameElm, "Platform").text 		= lbPlatform
-		ET.SubElement(gameElm, "Emulator").text 		= emuId
+	# Game elements are spooled, imported games replace the games of the platform with the same title
+	lbGamesSpool 	= lbXml + ".games.tmp"
+	lbGames 		= collections.OrderedDict()
+	with open(lbGamesSpool, "wb") as spool:
+		for gameInfos in eXoGames:
+			lbeXoGame = nameCleaner.sub('', gameInfos.gamename).strip()
+			if lbGames.pop(lbeXoGame, None) is not None:
+				logging.info("> Game '%s' imported twice for Platform '%s'! Replacing...", lbeXoGame, lbPlatform)
+			logging.info("Importing game '%s'...", lbeXoGame)
+			gameElm = ET.Element("Game")
+			ET.SubElement(gameElm, "ID").text 				= str(uuid.uuid1())
+			ET.SubElement(gameElm, "Title").text 			= lbeXoGame
+			ET.SubElement(gameElm, "ApplicationPath").text 	= gameInfos.exofile
+			ET.SubElement(gameElm, "Developer").text 		= gameInfos.developer
+			ET.SubElement(gameElm, "Publisher").text 		= gameInfos.publisher
+			ET.SubElement(gameElm, "ReleaseDate").text 		= datetime.datetime(int(gameInfos.year), 1, 1, 0, 0).isoformat()
+			ET.SubElement(gameElm, "Genre").text 			= gameInfos.genre
+			ET.SubElement(gameElm, "Series").text 			= gameInfos.serie
+			ET.SubElement(gameElm, "Notes").text 			= gameInfos.info
+			ET.SubElement(gameElm, "DateAdded").text 		= datetime.datetime.now().isoformat()
+			ET.SubElement(gameElm, "DateModified").text 	= datetime.datetime.now().isoformat()
+			ET.SubElement(gameElm, "Platform").text 		= lbPlatform
+			ET.SubElement(gameElm, "Emulator")
+			if gameInfos.manual:
+				ET.SubElement(gameElm, "ManualPath").text = gameInfos.manual
+			gameXml = ET.tostring(gameElm, encoding="us-ascii")
+			lbGames[lbeXoGame] = (spool.tell(), len(gameXml))
+			spool.write(gameXml)
+	
+	# Removing games not in the collection anymore
+	prunedOutputs = set()
+	if doPrune:
+		prunedOutputs = set(request.importManifest.prune())
+	request.importManifest.save()
+
+	# Streaming the xml, untouched elements are copied through
+	logging.info("Updating 'LaunchBox.xml'...")
+	request.timings.start("xml")
+	lbXmlTmp 	= lbXml + ".tmp"
+	rootAttribs = dict()
+	emuId 		= None
+	hasPlatform = False
+	with open(lbXmlTmp, "wb") as fo:
+		# LaunchBox files start with a declaration, the elements are written in us-ascii
+		fo.write("<?xml version='1.0' encoding='us-ascii'?>\n")
+		isStarted = False
+		for element in iterXmlChildren(lbXml, rootAttribs):
+			if not isStarted:
+				fo.write(getXmlStartTag(rootAttribs))
+				isStarted = True
+			if element.tag == "Emulator" and element.findtext("Title") == lbEmulator:
+				emuId = element.findtext("ID")
+			elif element.tag == "Platform" and element.findtext("Name") == lbPlatform:
+				hasPlatform = True
+			elif element.tag == "Game" and element.findtext("Platform") == lbPlatform:
+				if element.findtext("Title") in lbGames:
+					logging.info("> Game '%s' found for Platform '%s'! Replacing...", element.findtext("Title"), lbPlatform)
+					continue
+				if element.findtext("ApplicationPath") in prunedOutputs:
+					logging.info("> Removing game '%s'...", element.findtext("Title"))
+					continue
+			writeXmlChild(fo, element)
+		if not isStarted:
+			fo.write(getXmlStartTag(rootAttribs))
 		
-		# Artworks and manual
-		if gameInfos.front: 	eXoMoveFile(lbeXoGame, gameInfos.front, lbeXoFrontsDir)
-		if gameInfos.back: 		eXoMoveFile(lbeXoGame, gameInfos.back, lbeXoBacksDir)
-		if gameInfos.title: 	eXoMoveFile(lbeXoGame + "-01", gameInfos.title, lbeXoScreensDir)
-		if gameInfos.screen:	eXoMoveFile(lbeXoGame + "-02", gameInfos.screen, lbeXoScreensDir)
-		if gameInfos.manual: 	ET.SubElement(gameElm, "ManualPath").text = eXoMoveFile(lbeXoGame, gameInfos.manual, lbeXoManualsDir)
+		# Emulator
+		newElements 		= []
+		isEmulatorCreated 	= False
+		if emuId is not None:
+			logging.info("Reading Emulator '%s' informations...", lbEmulator)
+		else:
+			logging.info("Creating Emulator '%s'...", lbEmulator)
+			isEmulatorCreated = True
+			emuId	= str(uuid.uuid1())
+			emuElm 	= ET.Element("Emulator")
+			newElements.append(emuElm)
+			ET.SubElement(emuElm, "ID").text 								= emuId
+			ET.SubElement(emuElm, "Title").text 							= lbEmulator
+			ET.SubElement(emuElm, "ApplicationPath").text 					= scriptpath
+			ET.SubElement(emuElm, "CommandLine").text 						= "-r"
+			ET.SubElement(emuElm, "NoQuotes").text 							= "false"
+			ET.SubElement(emuElm, "NoSpace").text 							= "false"
+			ET.SubElement(emuElm, "HideConsole").text 						= "false"
+			ET.SubElement(emuElm, "FileNameWithoutExtensionAndPath").text 	= "false"
+			ET.SubElement(emuElm, "DefaultPlatform")
+	
+		# Platform
+		isPlatformCreated = False
+		if not hasPlatform:
+			logging.info("Creating Platform '%s'...", lbPlatform)
+			isPlatformCreated = True
+			platformElm = ET.Element("Platform")
+			newElements.append(platformElm)
+			ET.SubElement(platformElm, "Name").text = str(lbPlatform)
+	
+		# EmulatorPlatform
+		if isEmulatorCreated or isPlatformCreated:
+			logging.info("Creating EmulatorPlatform...")
+			platformElm = ET.Element("EmulatorPlatform")
+			newElements.append(platformElm)
+			ET.SubElement(platformElm, "Emulator").text = emuId
+			ET.SubElement(platformElm, "Platform").text = lbPlatform
+			ET.SubElement(platformElm, "Default").text = "false"
+			ET.SubElement(platformElm, "CommandLine")
 		
-		# Caching game
-		if lbeXoGame not in lbGames: lbGames[lbeXoGame] = dict()
-		lbGames[lbeXoGame][lbPlatform] = gameElm
-
-	# Save the xml
+		for element in newElements:
+			writeXmlChild(fo, element)
+		
+		# Games, read back from the spool one at a time
+		with open(lbGamesSpool, "rb") as spool:
+			for offset, size in lbGames.values():
+				spool.seek(offset)
+				gameElm = ET.fromstring(spool.read(size))
+				gameElm.find("Emulator").text = emuId
+				writeXmlChild(fo, gameElm)
+		fo.write("</%s>\n" % rootAttribs["__tag__"])
+	
+	# The previous xml is the backup
 	logging.info("Backing up 'LaunchBox.xml'...")
-	shutil.copyfile(lbXml, os.path.join(lbDir, "LaunchBox.eXoBackup." + timestamp() + ".xml"))
-	logging.info("Saving updated 'LaunchBox.xml'...")
-	xmlIndent(lbElm)
-	gamelistTree = ET.ElementTree(lbElm)
-	xmlDoc.write(os.path.join(lbDir, "LaunchBox.xml"), xml_declaration=True)
-
-	# Removing temp directory
-	logging.info("Removing temporary directory...")
-	rmTempDir(tempDir)
+	os.rename(lbXml, os.path.join(lbDir, "LaunchBox.eXoBackup." + timestamp() + ".xml"))
+	os.rename(lbXmlTmp, lbXml)
+	os.remove(lbGamesSpool)
 
 
 #*****************************************************************
@@ -987,6 +3350,29 @@ def main(argv):
 	global dbDir
 	global dbExePath
 	global eXoCollections
+	global extractWorkers
+	global slotsBudget
+	global saveGenerations
+	global slotMode
+	global basesBudget
+	global poolExtensions
+	global poolMinSize
+	global archiveCacheDir
+	global archiveCacheBudget
+	global archiveCacheWarmup
+	global archivecachelockfile
+	global artworkMaxSize
+	global artworkFormat
+	global artworkQuality
+	global daemonPort
+	global daemonWarmup
+	
+	#*****************************************************************
+	# Daemon
+	# Frontends calls are run by the daemon when it's running
+	status = eXoDaemonClient(argv)
+	if status is not None:
+		sys.exit(status)
 	
 	#*****************************************************************
 	# Working directories
@@ -994,6 +3380,10 @@ def main(argv):
 	if not os.path.isdir(workingdir): 	os.makedirs(workingdir)
 	if not os.path.isdir(gamesdir): 	os.makedirs(gamesdir)
 	if not os.path.isdir(savesdir): 	os.makedirs(savesdir)
+	if not os.path.isdir(saveobjectsdir): 	os.makedirs(saveobjectsdir)
+	if not os.path.isdir(basesdir): 	os.makedirs(basesdir)
+	if not os.path.isdir(pooldir): 		os.makedirs(pooldir)
+	if not os.path.isdir(locksdir): 	os.makedirs(locksdir)
 
 	#*****************************************************************
 	# Logging
@@ -1043,12 +3433,99 @@ def main(argv):
 		logging.error("DosBOX '" + dbExePath + "' not found!")
 		sys.exit(1)
 
+	# Get extraction workers
+	if eXoLConfig.has_option(_eXoLoaderSection, "ExtractWorkers"):
+		extractWorkers = max(1, eXoLConfig.getint(_eXoLoaderSection, "ExtractWorkers"))
+	logging.debug("Extraction workers : " + str(extractWorkers))
+
+	# Get slots budget
+	if eXoLConfig.has_option(_eXoLoaderSection, "SlotsBudget"):
+		slotsBudget = parseSize(eXoLConfig.get(_eXoLoaderSection, "SlotsBudget"))
+	logging.debug("Slots budget : " + str(slotsBudget))
+
+	# Get save generations to keep
+	if eXoLConfig.has_option(_eXoLoaderSection, "SaveGenerations"):
+		saveGenerations = max(1, eXoLConfig.getint(_eXoLoaderSection, "SaveGenerations"))
+	logging.debug("Save generations : " + str(saveGenerations))
+
+	# Get slot mode, overlay needs a DOSBox with 'mount -t overlay' (DOSBox-X, DOSBox Staging)
+	if eXoLConfig.has_option(_eXoLoaderSection, "SlotMode"):
+		slotMode = eXoLConfig.get(_eXoLoaderSection, "SlotMode").strip().lower()
+		if slotMode not in [_ExtractSlotMode, _OverlaySlotMode]:
+			logging.error("Invalid slot mode '%s'!", slotMode)
+			sys.exit(1)
+	logging.debug("Slot mode : " + slotMode)
+
+	# Get extracted archives budget
+	if eXoLConfig.has_option(_eXoLoaderSection, "BasesBudget"):
+		basesBudget = parseSize(eXoLConfig.get(_eXoLoaderSection, "BasesBudget"))
+	logging.debug("Bases budget : " + str(basesBudget))
+
+	# Get pooled files extensions (empty to disable the pool) and minimum size
+	if eXoLConfig.has_option(_eXoLoaderSection, "PoolExtensions"):
+		poolExtensions = [extension.strip().lower() for extension in eXoLConfig.get(_eXoLoaderSection, "PoolExtensions").split(",") if extension.strip()]
+	if eXoLConfig.has_option(_eXoLoaderSection, "PoolMinSize"):
+		poolMinSize = parseSize(eXoLConfig.get(_eXoLoaderSection, "PoolMinSize"))
+	logging.debug("Pooled extensions : " + ", ".join(poolExtensions))
+
+	# Get local archives cache (for collections on network shares), its budget & archives to cache while playing
+	if eXoLConfig.has_option(_eXoLoaderSection, "ArchiveCache"):
+		archiveCacheDir = eXoLConfig.get(_eXoLoaderSection, "ArchiveCache").strip()
+	if archiveCacheDir:
+		archiveCacheDir 		= os.path.abspath(archiveCacheDir)
+		archivecachelockfile 	= os.path.join(archiveCacheDir, scriptName + ".lock")
+		if not os.path.isdir(archiveCacheDir): os.makedirs(archiveCacheDir)
+	if eXoLConfig.has_option(_eXoLoaderSection, "ArchiveCacheBudget"):
+		archiveCacheBudget = parseSize(eXoLConfig.get(_eXoLoaderSection, "ArchiveCacheBudget"))
+	if eXoLConfig.has_option(_eXoLoaderSection, "ArchiveCacheWarmup"):
+		archiveCacheWarmup = max(0, eXoLConfig.getint(_eXoLoaderSection, "ArchiveCacheWarmup"))
+	logging.debug("Archives cache : %s (budget : %s)", archiveCacheDir or "none", str(archiveCacheBudget))
+
+	# Get artworks maximum resolution (<width>x<height>), format (jpg, png) & quality, needs PIL
+	if eXoLConfig.has_option(_eXoLoaderSection, "ArtworkMaxSize"):
+		matchObj = resolutionMatcher.match(eXoLConfig.get(_eXoLoaderSection, "ArtworkMaxSize"))
+		if matchObj is None:
+			logging.error("Invalid artwork maximum size '%s', use <width>x<height>!", eXoLConfig.get(_eXoLoaderSection, "ArtworkMaxSize"))
+			sys.exit(1)
+		artworkMaxSize = (int(matchObj.group(1)), int(matchObj.group(2)))
+	if eXoLConfig.has_option(_eXoLoaderSection, "ArtworkFormat"):
+		artworkFormat = eXoLConfig.get(_eXoLoaderSection, "ArtworkFormat").strip().lower().lstrip(".").replace("jpeg", "jpg") or None
+		if artworkFormat and artworkFormat not in _ArtworkFormats:
+			logging.error("Invalid artwork format '%s'!", artworkFormat)
+			sys.exit(1)
+	if eXoLConfig.has_option(_eXoLoaderSection, "ArtworkQuality"):
+		artworkQuality = min(100, max(1, eXoLConfig.getint(_eXoLoaderSection, "ArtworkQuality")))
+	logging.debug("Artworks : %s, %s, quality %i", artworkMaxSize, artworkFormat, artworkQuality)
+
+	# Get DOSBox overrides : [Overrides] for every game, [Overrides.<GameName>] for one game
+	for section in eXoLConfig.sections():
+		if section == _OverridesSection or section.startswith(_OverridesSection + "."):
+			gamename = section[len(_OverridesSection) + 1:] or None
+			for option in eXoLConfig.options(section):
+				if "." not in option:
+					logging.error("Invalid override '%s' in [%s], use <section>.<key>!", option, section)
+					sys.exit(1)
+				dbSection, dbKey = option.split(".", 1)
+				dbOverrides.setdefault(gamename, []).append([dbSection.strip().lower(), dbKey.strip().lower(), eXoLConfig.get(section, option, True)])
+				logging.debug("Override[%s] : [%s] %s=%s", gamename or "*", dbSection, dbKey, dbOverrides[gamename][-1][2])
+
 	# Get eXoDOS collections
 	eXoCollections = []
 	for option in eXoLConfig.options("Collections"):
 		colpath = eXoLConfig.get("Collections", option)
 		logging.debug("Collection[" + option + "] : " + colpath)
 		eXoCollections.append(colpath)
+
+	# Get daemon TCP port (when there are no unix sockets) & games to prefetch while playing
+	if eXoLConfig.has_option(_eXoLoaderSection, "DaemonPort"):
+		daemonPort = eXoLConfig.getint(_eXoLoaderSection, "DaemonPort")
+	if eXoLConfig.has_option(_eXoLoaderSection, "DaemonWarmup"):
+		daemonWarmup = max(0, eXoLConfig.getint(_eXoLoaderSection, "DaemonWarmup"))
+	
+	eXoRun(argv)
+
+def eXoRun(argv):
+	# Runs one command line, once per process or once per daemon request
 	
 	#*****************************************************************
 	# Arguments
@@ -1058,9 +3535,14 @@ def main(argv):
 	outputDir			= ""
 	doImportArtworks	= False
 	doImportManuals		= False
+	doPrune				= False
+	showTimings			= False
+	prefetchList		= []
+	listFile			= ""
+	scanDir				= ""
 	
 	try:
-	  opts, args = getopt.getopt(argv,"hami:o:l:",["launch","install","remove","rom=","output="])
+	  opts, args = getopt.getopt(argv, _ShortOptions, _LongOptions)
 	except getopt.GetoptError:
 	  logging.info(_eXoLauncherHelp)
 	  sys.exit(2)
@@ -1068,11 +3550,11 @@ def main(argv):
 	  if opt == '-h':
 		logging.info(_eXoLauncherHelp)
 		sys.exit()
-	  elif opt in ("--launch"):
+	  elif opt == "--launch":
 		mode = _LaunchMode
-	  elif opt in ("--install"):
+	  elif opt == "--install":
 		mode = _InstallMode
-	  elif opt in ("--remove"):
+	  elif opt == "--remove":
 		mode = _RemoveMode
 	  elif opt in ("-r", "--rom"):
 		romfile = arg
@@ -1082,15 +3564,49 @@ def main(argv):
 	  elif opt in ("-l", "--outputlb"):
 		mode = _ImportLBMode
 		collection = arg
+	  elif opt in ("-j", "--jobs"):
+		request.importJobs = max(1, int(arg))
 	  elif opt in ("-o", "--output"):
 		outputDir = arg
 		if not os.path.isdir(outputDir):
 			logging.error("Invalid output directory '" + outputDir + "'!")
 			sys.exit(2)
-	  elif opt in ("-a"):
+	  elif opt == "-a":
 		doImportArtworks = True
-	  elif opt in ("-m"):
+	  elif opt == "-m":
 		doImportManuals = True
+	  elif opt == "--verify":
+		request.fullVerify = True
+	  elif opt == "--cache-status":
+		mode = _CacheStatusMode
+	  elif opt == "--prefetch":
+		mode = _PrefetchMode
+		prefetchList = readListFile(arg)
+	  elif opt == "--prefetch-recent":
+		mode = _PrefetchMode
+		prefetchList = getRecentGames(int(arg))
+	  elif opt == "--reindex":
+		mode = _ReindexMode
+	  elif opt == "--prune":
+		doPrune = True
+	  elif opt == "--timings":
+		showTimings = True
+	  elif opt == "--save-generation":
+		request.saveGeneration = max(0, int(arg))
+	  elif opt == "--install-list":
+		mode = _InstallListMode
+		listFile = arg
+	  elif opt == "--remove-list":
+		mode = _RemoveListMode
+		listFile = arg
+	  elif opt == "--daemon":
+		mode = _DaemonMode
+	  elif opt == "--scan":
+		mode = _ScanMode
+		scanDir = arg
+	  elif opt == "--warm-archives":
+		mode = _WarmArchivesMode
+		prefetchList = getRecentGames(int(arg))
 
 	if mode == _LaunchMode:
 		# Launch the rom file
@@ -1101,30 +3617,67 @@ def main(argv):
 	elif mode == _RemoveMode:
 		# Launch the rom file
 		eXoRemove(romfile)
+	elif mode == _CacheStatusMode:
+		# Slots usage report
+		eXoCacheStatus()
+	elif mode == _PrefetchMode:
+		# Install games ahead of launch
+		eXoPrefetch(prefetchList)
+	elif mode == _ReindexMode:
+		# Rebuild the collections index
+		eXoReindex()
+	elif mode == _InstallListMode:
+		# Install many games at once
+		eXoInstallList(readListFile(listFile))
+	elif mode == _RemoveListMode:
+		# Remove many games at once
+		eXoRemoveList(readListFile(listFile))
+	elif mode == _DaemonMode:
+		# Serve frontends requests
+		eXoDaemon()
+	elif mode == _ScanMode:
+		# Fill the eXo files cache
+		eXoScan(scanDir)
+	elif mode == _WarmArchivesMode:
+		# Cache the archives of the last launched games
+		eXoWarmArchives(prefetchList)
 	elif mode == _ImportMode:
 		if not outputDir:
 			logging.error("You must provides an output directory (-o)!")
 			logging.info(_eXoLauncherHelp)
 		else:
 			# Convert the collection
-			eXoImportCollection(collection, outputDir, doImportArtworks, doImportManuals)
+			eXoGames = eXoImportCollection(collection, outputDir, doImportArtworks, doImportManuals, doPrune)
+			if eXoGames != 1:
+				for eXoGameInfos in eXoGames:
+					pass
 	elif mode == _ImportLBMode:
 		if not outputDir:
 			logging.error("You must provides LaunchBox directory (-l)!")
 			logging.info(_eXoLauncherHelp)
 		else:
 			# Convert the collection
-			eXoImportCollectionLB(collection, outputDir, doImportArtworks, doImportManuals)
+			eXoImportCollectionLB(collection, outputDir, doImportArtworks, doImportManuals, doPrune)
 	else:
 		logging.info(_eXoLauncherHelp)
 
+	#*****************************************************************
+	# Timings
+	request.timings.stop()
+	if mode in _TimedModes:
+		request.timings.record(_TimedModes[mode], romfile or collection or listFile or scanDir or None)
+	if showTimings:
+		request.timings.report()
+
 if __name__ == "__main__":
 	try:
 		main(sys.argv[1:])
+	except SystemExit:
+		raise
 	except:
 		logging.error("****************************")
 		logging.error("Unexpected error!")
 		logging.info("Cleaning stuffs...")
-		for tempDir in tempDirs:
+		for tempDir in list(tempDirs):
 			rmTempDir(tempDir)
 		logging.debug(traceback.format_exc())